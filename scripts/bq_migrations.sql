@@ -32,3 +32,16 @@ CREATE TABLE IF NOT EXISTS `amazon_ops.probe_sales_asin_daily_v1` (
   excluded_non_amazon_orders INT64,
   ingested_at TIMESTAMP
 );
+
+-- Checkpoint of processed orders (spapi_probe/bq.py).
+-- Partitioned on snapshot_date so the per-day lookup prunes to a single partition.
+-- An existing unpartitioned table must be recreated (CREATE TABLE ... PARTITION BY ... AS SELECT) to gain pruning.
+CREATE TABLE IF NOT EXISTS `amazon_ops.etl_orders_checkpoint` (
+  snapshot_date DATE,
+  scope STRING,
+  region STRING,
+  order_id STRING,
+  processed_at TIMESTAMP
+)
+PARTITION BY snapshot_date
+CLUSTER BY scope;
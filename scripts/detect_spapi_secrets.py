@@ -1,107 +1,137 @@
 from __future__ import annotations
 
 import argparse
+import os
 import subprocess
 import sys
-from typing import List, Tuple
+from typing import List, Optional
 
+try:
+    from google.api_core import exceptions as gapi_exceptions  # type: ignore
+    from google.auth import exceptions as gauth_exceptions  # type: ignore
+    from google.cloud import secretmanager  # type: ignore
 
-def _collect_names() -> List[str]:
+    # No ADC (only `gcloud auth login`) or no API permission: the gcloud CLI may still work
+    _API_FALLBACK_ERRORS: tuple = (gauth_exceptions.DefaultCredentialsError, gapi_exceptions.PermissionDenied)
+except Exception:
+    secretmanager = None  # type: ignore
+    _API_FALLBACK_ERRORS = ()
+
+
+def _collect_names_gcloud(project: Optional[str]) -> List[str]:
+    cmd = ["gcloud", "secrets", "list", "--format=value(name)"]
+    if project:
+        cmd.append(f"--project={project}")
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return [line.strip() for line in (result.stdout or "").splitlines() if line.strip()]
+
+
+def _collect_names_api(project: str) -> List[str]:
+    client = secretmanager.SecretManagerServiceClient()
+    secrets = client.list_secrets(request={"parent": f"projects/{project}"})
+    # Secret resource names look like projects/<number>/secrets/<name>
+    return [s.name.rsplit("/", 1)[-1] for s in secrets]
+
+
+def _collect_names(project: Optional[str] = None) -> List[str]:
+    """
+    List secret names via the Secret Manager API when the client library and a
+    project are available; otherwise (or with USE_GCLOUD=1) shell out to gcloud.
+    Missing application default credentials or PermissionDenied from the API
+    also fall back to gcloud.
+    """
+    use_api = secretmanager is not None and bool(project) and os.getenv("USE_GCLOUD") != "1"
     try:
-        result = subprocess.run(
-            ["gcloud", "secrets", "list", "--format=value(name)"],
-            check=True,
-            capture_output=True,
-            text=True,
-        )
+        if use_api:
+            try:
+                return _collect_names_api(project)
+            except _API_FALLBACK_ERRORS as exc:
+                print(f"Secret Manager API unavailable ({type(exc).__name__}); using gcloud", file=sys.stderr)
+        return _collect_names_gcloud(project)
     except Exception as exc:
         print(f"Failed to list secrets: {exc}", file=sys.stderr)
         raise
-    return [line.strip() for line in (result.stdout or "").splitlines() if line.strip()]
 
 
-def _pick_first(names: List[Tuple[str, str]], predicate) -> str:
-    for raw, lowered in names:
-        if predicate(lowered):
-            return raw
-    return ""
-
-
-def _select_client_id(names: List[Tuple[str, str]]) -> str:
-    candidate = _pick_first(names, lambda s: "lwa" in s and "client" in s and "id" in s)
-    if candidate:
-        return candidate
-    for raw, lowered in names:
-        if lowered == "spapi-lwa-client-id" or "spapi-lwa-client-id" in lowered:
-            return raw
-    return ""
-
-
-def _select_client_secret(names: List[Tuple[str, str]]) -> str:
-    candidate = _pick_first(names, lambda s: "lwa" in s and "client" in s and "secret" in s)
-    if candidate:
-        return candidate
-    for raw, lowered in names:
-        if lowered == "spapi-lwa-client-secret" or "spapi-lwa-client-secret" in lowered:
-            return raw
-    return ""
-
-
-def _pick_refresh(
-    names: List[Tuple[str, str]],
-    *,
-    include_tokens: List[str],
-    exclude_tokens: List[str],
-) -> str:
-    def matches(lowered: str) -> bool:
-        if "refresh" not in lowered:
-            return False
-        for token in include_tokens:
-            if token not in lowered:
-                return False
-        for token in exclude_tokens:
-            if token in lowered:
-                return False
-        return True
-
-    return _pick_first(names, matches)
-
-
-def _select_refresh(names: List[Tuple[str, str]], scope: str) -> str:
-    scope_norm = (scope or "").strip().lower() or "eu"
-    if scope_norm == "eu":
-        picked = _pick_refresh(names, include_tokens=["eu"], exclude_tokens=[])
-        if picked:
-            return picked
-        picked = _pick_refresh(names, include_tokens=["na"], exclude_tokens=[])
-        if picked:
-            return picked
-    elif scope_norm == "na":
-        picked = _pick_refresh(names, include_tokens=["na"], exclude_tokens=[])
-        if picked:
-            return picked
-        picked = _pick_refresh(names, include_tokens=["eu"], exclude_tokens=[])
-        if picked:
-            return picked
-
-    return _pick_refresh(names, include_tokens=[], exclude_tokens=["eu", "na"])
+_LWA = 1
+_CLIENT = 2
+_ID = 4
+_SECRET = 8
+_REFRESH = 16
+_EU = 32
+_NA = 64
+
+_TOKEN_BITS = (
+    (b"lwa", _LWA),
+    (b"client", _CLIENT),
+    (b"id", _ID),
+    (b"secret", _SECRET),
+    (b"refresh", _REFRESH),
+    (b"eu", _EU),
+    (b"na", _NA),
+)
+
+_CLIENT_ID_MASK = _LWA | _CLIENT | _ID
+_CLIENT_SECRET_MASK = _LWA | _CLIENT | _SECRET
+
+# Refresh-token slots tried in order per scope; "" is the region-less token.
+_REFRESH_PREFERENCE = {
+    "eu": ("eu", "na", ""),
+    "na": ("na", "eu", ""),
+}
+
+
+def _classify(name: str) -> int:
+    # Secret Manager names are limited to [A-Za-z0-9_-], so an ASCII byte view
+    # is lossless and lets every token probe run on bytes.
+    lowered = name.encode("ascii", "ignore").lower()
+    mask = 0
+    for token, bit in _TOKEN_BITS:
+        if token in lowered:
+            mask |= bit
+    return mask
 
 
 def _select_secrets(names: List[str], scope: str) -> List[str]:
-    lowered = [(n, n.lower()) for n in names]
-    client_id = _select_client_id(lowered)
-    client_secret = _select_client_secret(lowered)
-    refresh = _select_refresh(lowered, scope)
+    client_id = ""
+    client_secret = ""
+    refresh_slots = {"eu": "", "na": "", "": ""}
+    for raw in names:
+        mask = _classify(raw)
+        if not client_id and mask & _CLIENT_ID_MASK == _CLIENT_ID_MASK:
+            client_id = raw
+        if not client_secret and mask & _CLIENT_SECRET_MASK == _CLIENT_SECRET_MASK:
+            client_secret = raw
+        if not mask & _REFRESH:
+            continue
+        if not refresh_slots["eu"] and mask & _EU:
+            refresh_slots["eu"] = raw
+        if not refresh_slots["na"] and mask & _NA:
+            refresh_slots["na"] = raw
+        if not refresh_slots[""] and not mask & (_EU | _NA):
+            refresh_slots[""] = raw
+
+    scope_norm = (scope or "").strip().lower() or "eu"
+    refresh = ""
+    for slot in _REFRESH_PREFERENCE.get(scope_norm, ("",)):
+        refresh = refresh_slots[slot]
+        if refresh:
+            break
     return [client_id, client_secret, refresh]
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Detect SP-API secret names.")
     parser.add_argument("--scope", default="EU", help="Scope for refresh token selection.")
+    parser.add_argument(
+        "--project",
+        default=os.getenv("GOOGLE_CLOUD_PROJECT") or os.getenv("CLOUDSDK_CORE_PROJECT"),
+        help="GCP project to list secrets from (defaults to GOOGLE_CLOUD_PROJECT or the gcloud config).",
+    )
     args = parser.parse_args()
 
     try:
-        names = _collect_names()
+        names = _collect_names(args.project)
     except Exception:
         return 1
 
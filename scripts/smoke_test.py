@@ -1,16 +1,22 @@
-import importlib.util
+import argparse
+import asyncio
 import json
 import os
 import sys
 import types
+from contextlib import contextmanager
 from datetime import date
+from functools import cache
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from spapi_probe import config  # noqa: E402
 
-if importlib.util.find_spec("requests") is None:
-    sys.modules["requests"] = types.SimpleNamespace()
+try:
+    import requests  # noqa: F401
+except ImportError:
+    sys.modules["requests"] = types.ModuleType("requests")
 
 from spapi_probe import spapi_core  # noqa: E402
 
@@ -24,26 +30,35 @@ DRY_TRUE = 1
 SMALL_ONE = 1
 
 
-def _run_spapi_shape_tests() -> None:
-    original = spapi_core.spapi_request
+@contextmanager
+def _patched(target: Any, name: str, value: Any) -> Iterator[None]:
+    """Temporarily replace target.name, restoring it on exit."""
+    original = getattr(target, name)
+    setattr(target, name, value)
     try:
-        spapi_core.spapi_request = lambda **_: (200, {"hello": "world"}, {"rid": "x"})
+        yield
+    finally:
+        setattr(target, name, original)
+
+
+def _run_spapi_shape_tests() -> None:
+    ok_request = lambda **_: (200, {"hello": "world"}, {"rid": "x"})
+    with _patched(spapi_core, "spapi_request", ok_request):
         ok_resp = spapi_core.spapi_request_json(scope="EU", method="GET", path="/__test__")
-        assert isinstance(ok_resp, dict)
-        assert ok_resp.get("ok") is True
-        assert ok_resp.get("payload", {}).get("hello") == "world"
-        assert "debug" in ok_resp and "status" in ok_resp
-
-        spapi_core.spapi_request = lambda **_: (
-            403,
-            {"errors": [{"message": "Forbidden", "code": "Unauthorized"}]},
-            {"rid": "y"},
-        )
+    assert isinstance(ok_resp, dict)
+    assert ok_resp.get("ok") is True
+    assert ok_resp.get("payload", {}).get("hello") == "world"
+    assert "debug" in ok_resp and "status" in ok_resp
+
+    forbidden_request = lambda **_: (
+        403,
+        {"errors": [{"message": "Forbidden", "code": "Unauthorized"}]},
+        {"rid": "y"},
+    )
+    with _patched(spapi_core, "spapi_request", forbidden_request):
         bad_resp = spapi_core.spapi_request_json(scope="EU", method="GET", path="/__test__")
-        assert bad_resp.get("ok") is False
-        assert bad_resp.get("error")
-    finally:
-        spapi_core.spapi_request = original
+    assert bad_resp.get("ok") is False
+    assert bad_resp.get("error")
 
 def _run_refresh_token_selection_tests() -> None:
     from spapi_probe import spapi_client  # noqa: E402
@@ -88,58 +103,56 @@ def _run_refresh_token_selection_tests() -> None:
 def _run_orders_parse_tests() -> None:
     from spapi_probe import orders_agg  # noqa: E402
 
-    original = orders_agg.spapi_request_json
-    try:
-        seen_marketplace_ids = []
-
-        def _mock_spapi_request_json(*, scope: str, method: str, path: str, query=None, **_kwargs):
-            if path == "/orders/v0/orders":
-                seen_marketplace_ids.append((query or {}).get("MarketplaceIds"))
-            if path == "/orders/v0/orders":
-                return {
-                    "ok": True,
-                    "status": 200,
+    seen_marketplace_ids = []
+
+    def _mock_spapi_request_json(*, scope: str, method: str, path: str, query=None, **_kwargs):
+        if path == "/orders/v0/orders":
+            seen_marketplace_ids.append((query or {}).get("MarketplaceIds"))
+        if path == "/orders/v0/orders":
+            return {
+                "ok": True,
+                "status": 200,
+                "payload": {
                     "payload": {
-                        "payload": {
-                            "Orders": [
-                                {
-                                    "AmazonOrderId": "ORDER1",
-                                    "MarketplaceId": "A1PA6795UKMFR9",
-                                    "OrderStatus": "Shipped",
-                                    "SalesChannel": "Amazon",
-                                },
-                                {
-                                    "AmazonOrderId": "ORDER2",
-                                    "MarketplaceId": "A13V1IB3VIYZZH",
-                                    "OrderStatus": "Canceled",
-                                    "SalesChannel": "Amazon",
-                                },
-                            ],
-                            "NextToken": None,
-                        }
-                    },
-                    "debug": {"rid": "x"},
-                }
-            if path.endswith("/orderItems"):
-                return {
-                    "ok": True,
-                    "status": 200,
+                        "Orders": [
+                            {
+                                "AmazonOrderId": "ORDER1",
+                                "MarketplaceId": "A1PA6795UKMFR9",
+                                "OrderStatus": "Shipped",
+                                "SalesChannel": "Amazon",
+                            },
+                            {
+                                "AmazonOrderId": "ORDER2",
+                                "MarketplaceId": "A13V1IB3VIYZZH",
+                                "OrderStatus": "Canceled",
+                                "SalesChannel": "Amazon",
+                            },
+                        ],
+                        "NextToken": None,
+                    }
+                },
+                "debug": {"rid": "x"},
+            }
+        if path.endswith("/orderItems"):
+            return {
+                "ok": True,
+                "status": 200,
+                "payload": {
                     "payload": {
-                        "payload": {
-                            "OrderItems": [
-                                {
-                                    "ASIN": "B000TEST",
-                                    "SellerSKU": "SKU1",
-                                    "QuantityOrdered": 2,
-                                }
-                            ]
-                        }
-                    },
-                    "debug": {"rid": "y"},
-                }
-            return {"ok": False, "status": 404, "payload": {}, "error": "not found", "debug": {}}
-
-        orders_agg.spapi_request_json = _mock_spapi_request_json
+                        "OrderItems": [
+                            {
+                                "ASIN": "B000TEST",
+                                "SellerSKU": "SKU1",
+                                "QuantityOrdered": 2,
+                            }
+                        ]
+                    }
+                },
+                "debug": {"rid": "y"},
+            }
+        return {"ok": False, "status": 404, "payload": {}, "error": "not found", "debug": {}}
+
+    with _patched(orders_agg, "spapi_request_json", _mock_spapi_request_json):
         out = orders_agg.run_daily(
             scope="EU",
             snapshot_date=date(YEAR, MONTH, DAY),
@@ -160,32 +173,29 @@ def _run_orders_parse_tests() -> None:
         for entry in by_country.values():
             query = (entry or {}).get("query") or {}
             assert "," not in (query.get("MarketplaceIds") or "")
-    finally:
-        orders_agg.spapi_request_json = original
 
 def _run_list_orders_debug_shape_tests() -> None:
     from spapi_probe import orders_agg  # noqa: E402
 
-    original = orders_agg.spapi_request_json
-    try:
-        def _mock_spapi_request_json(*, scope: str, method: str, path: str, query=None, **_kwargs):
-            if path == "/orders/v0/orders":
-                return {
-                    "ok": True,
-                    "status": 200,
-                    "payload": {"payload": {"Orders": [{}], "NextToken": "X"}},
-                    "debug": {"rid": "x"},
-                }
-            if path.endswith("/orderItems"):
-                return {
-                    "ok": True,
-                    "status": 200,
-                    "payload": {"payload": {"OrderItems": []}},
-                    "debug": {"rid": "y"},
-                }
-            return {"ok": False, "status": 404, "payload": {}, "error": "not found", "debug": {}}
-
-        orders_agg.spapi_request_json = _mock_spapi_request_json
+    def _mock_spapi_request_json(*, scope: str, method: str, path: str, query=None, **_kwargs):
+        if path == "/orders/v0/orders":
+            return {
+                "ok": True,
+                "status": 200,
+                "payload": {"payload": {"Orders": [{}], "NextToken": "X"}},
+                "debug": {"rid": "x"},
+            }
+        if path.endswith("/orderItems"):
+            return {
+                "ok": True,
+                "status": 200,
+                "payload": {"payload": {"OrderItems": []}},
+                "debug": {"rid": "y"},
+            }
+        return {"ok": False, "status": 404, "payload": {}, "error": "not found", "debug": {}}
+
+    # A fresh probe cache, so the previous test's per-country responses are not reused
+    with _patched(orders_agg, "spapi_request_json", _mock_spapi_request_json), _patched(orders_agg, "_PROBE_CACHE", {}):
         out = orders_agg.run_daily(
             scope="EU",
             snapshot_date=date(YEAR, MONTH, DAY),
@@ -202,80 +212,218 @@ def _run_list_orders_debug_shape_tests() -> None:
         sample = next(iter(by_country.values()), {})
         assert sample.get("orders_in_batch") == ONE
         assert sample.get("has_next_token") is True
+
+
+def _run_retry_pacer_tests() -> None:
+    from spapi_probe import utils_rate  # noqa: E402
+
+    clock = [100.0]
+    pacer_sleeps: List[float] = []
+    fake_time = types.SimpleNamespace(monotonic=lambda: clock[0], sleep=pacer_sleeps.append)
+    with _patched(utils_rate, "time", fake_time):
+        pacer = utils_rate.RatePacer(2.0, burst=2.0)
+        pacer.wait()
+        pacer.wait()
+        assert pacer_sleeps == []
+        # Bucket empty: the third call waits one token at 2 req/s
+        pacer.wait()
+        assert pacer_sleeps == [0.5]
+        clock[0] += 1.0
+        pacer.wait()
+        assert pacer_sleeps == [0.5]
+        pacer.update_rate(None)
+        assert pacer.rate == 2.0
+        pacer.update_rate(4.0)
+        assert pacer.rate == 4.0
+
+    retry_sleeps: List[float] = []
+
+    def _responses(*resps: Dict[str, Any]) -> Tuple[Callable[[], Dict[str, Any]], List[int]]:
+        calls: List[int] = []
+
+        def fn() -> Dict[str, Any]:
+            calls.append(1)
+            return resps[min(len(calls), len(resps)) - 1]
+
+        return fn, calls
+
+    ok = {"ok": True, "status": 200, "debug": {}}
+    throttled = {"ok": False, "status": 429, "error": "throttled", "debug": {}}
+    with _patched(spapi_core, "time", types.SimpleNamespace(sleep=retry_sleeps.append)):
+        # Retry-After wins over the jittered backoff, capped at max_sleep
+        fn, calls = _responses({**throttled, "debug": {"retry_after": "2"}}, {**throttled, "debug": {"retry_after": "100"}}, ok)
+        assert spapi_core.retry_spapi(fn, stage="t", run_id="r") is ok
+        assert len(calls) == 3 and retry_sleeps == [2.0, 30.0]
+
+        retry_sleeps.clear()
+        fn, calls = _responses(throttled, {**throttled, "status": 503}, ok)
+        assert spapi_core.retry_spapi(fn, stage="t", run_id="r", base_sleep=1.0) is ok
+        assert len(retry_sleeps) == 2
+        assert 0 <= retry_sleeps[0] <= 1.0 and 0 <= retry_sleeps[1] <= 2.0
+
+        for resp, tries, status in (({**throttled, "status": 400}, 1, 400), (throttled, 3, 429)):
+            retry_sleeps.clear()
+            fn, calls = _responses(resp)
+            try:
+                spapi_core.retry_spapi(fn, stage="t", run_id="r", max_tries=3)
+                assert False, "expected SpapiRequestError"
+            except spapi_core.SpapiRequestError as exc:
+                assert exc.status == status
+            # No sleep follows the last attempt
+            assert len(calls) == tries and len(retry_sleeps) == tries - 1
+
+def _run_bq_chunk_index_tests() -> None:
+    from spapi_probe import bq, orders_agg  # noqa: E402
+
+    failing = {3, 6}
+
+    class _FakeClient:
+        """insert_rows_json reports a row error (chunk-relative index) for every row whose n is in `failing`."""
+
+        def __init__(self) -> None:
+            self.requests: List[int] = []
+
+        def insert_rows_json(self, table_id: str, rows: List[Dict[str, Any]], row_ids=None, retry=None) -> List[Dict[str, Any]]:
+            self.requests.append(len(rows))
+            return [
+                {"index": i, "errors": [{"reason": "invalid", "message": "bad value"}]}
+                for i, r in enumerate(rows)
+                if r["n"] in failing
+            ]
+
+    def _rows() -> List[Dict[str, Any]]:
+        return [{"n": n} for n in range(8)]
+
+    client = _FakeClient()
+    errors = bq.insert_rows_chunked(client, "t", _rows(), batch_size=3)
+    assert client.requests == [3, 3, 2]
+    assert [e["index"] for e in errors] == [3, 6]
+
+    client = _FakeClient()
+    writer = bq.BufferedRowWriter(client, "t", const={"run_id": "r"}, flush_every=3)
+    for row in _rows():
+        writer.add(row)
+    writer.flush()
+    assert client.requests == [3, 3, 2] and writer.count == 8
+    assert [e["index"] for e in writer.errors] == [3, 6]
+
+    client = _FakeClient()
+    with _patched(orders_agg, "RAW_ROWS_FLUSH_EVERY", 3):
+        raw_writer = orders_agg._RawRowsWriter(client, "t", {"run_id": "r"})
+        for row in _rows():
+            raw_writer.add(row)
+        res = raw_writer.result()
+    assert client.requests == [3, 3, 2]
+    assert res["failed_indexes"] == [3, 6]
+    assert [e["index"] for e in res["errors"]] == [3, 6]
+    assert res["inserted"] == 6
+
+
+@cache
+def _import_app():
+    """Return spapi_probe.main, or None when fastapi is not installed (probed once)."""
+    try:
+        from spapi_probe import main as app_module  # noqa: E402
+    except ModuleNotFoundError as exc:
+        if exc.name != "fastapi":
+            raise
+        return None
+    return app_module
+
+
+def _run_local_block_tests() -> Optional[str]:
+    app_module = _import_app()
+    if app_module is None:
+        return "skipped"
+    cron_daily = app_module.cron_daily
+    cron_inventory = app_module.cron_inventory
+
+    prev_k_service = os.environ.pop("K_SERVICE", None)
+    # Cloud Run detection is cached per process; re-evaluate with K_SERVICE removed
+    app_module._is_cloud_run.cache_clear()
+    try:
+        daily_resp = asyncio.run(cron_daily(
+            scope="EU",
+            snapshot_date="2026-01-17",
+            dry=DRY_FALSE,
+            debugItems=0,
+            compact=1,
+            filterMode="Created",
+            maxPages=1,
+            pageSize=1,
+            maxOrders=1,
+        ))
+        daily_body = getattr(daily_resp, "body", b"{}")
+        daily_data = json.loads(daily_body.decode("utf-8"))
+        assert daily_data.get("status") == "LOCAL_EXEC_BLOCKED"
+        assert daily_data.get("run_id")
+        assert daily_data.get("stage")
+        assert daily_data.get("error")
+
+        daily_dry_resp = asyncio.run(cron_daily(
+            scope="EU",
+            snapshot_date="2026-01-17",
+            dry=DRY_TRUE,
+            debugItems=0,
+            compact=1,
+            filterMode="Created",
+            maxPages=1,
+            pageSize=1,
+            maxOrders=1,
+        ))
+        daily_dry_body = getattr(daily_dry_resp, "body", b"{}")
+        daily_dry_data = json.loads(daily_dry_body.decode("utf-8"))
+        assert daily_dry_data.get("status") == "DRY_RUN"
+        assert daily_dry_data.get("run_id")
+
+        inv_resp = asyncio.run(cron_inventory(scope="EU", dry=DRY_FALSE))
+        inv_body = getattr(inv_resp, "body", b"{}")
+        inv_data = json.loads(inv_body.decode("utf-8"))
+        assert inv_data.get("status") == "LOCAL_EXEC_BLOCKED"
+        assert inv_data.get("run_id")
+        assert inv_data.get("stage")
+
+        inv_dry_resp = asyncio.run(cron_inventory(scope="EU", dry=DRY_TRUE))
+        inv_dry_body = getattr(inv_dry_resp, "body", b"{}")
+        inv_dry_data = json.loads(inv_dry_body.decode("utf-8"))
+        assert inv_dry_data.get("status") == "DRY_RUN"
+        assert inv_dry_data.get("run_id")
     finally:
-        orders_agg.spapi_request_json = original
+        if prev_k_service is not None:
+            os.environ["K_SERVICE"] = prev_k_service
+        app_module._is_cloud_run.cache_clear()
+    return None
+
 
+SUITES: Dict[str, List[Tuple[str, Callable[[], Optional[str]]]]] = {
+    "minimal": [],
+    "shape": [
+        ("spapi_shape_tests", _run_spapi_shape_tests),
+        ("refresh_token_tests", _run_refresh_token_selection_tests),
+        ("retry_pacer_tests", _run_retry_pacer_tests),
+        ("bq_chunk_index_tests", _run_bq_chunk_index_tests),
+    ],
+}
+SUITES["full"] = SUITES["shape"] + [
+    ("orders_parse_tests", _run_orders_parse_tests),
+    ("list_orders_debug_shape_tests", _run_list_orders_debug_shape_tests),
+    ("local_block_tests", _run_local_block_tests),
+]
 
-def main() -> None:
-    fastapi_spec = importlib.util.find_spec("fastapi")
-    if fastapi_spec is None:
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="spapi_probe smoke tests")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="full", help="Test group to run")
+    args = parser.parse_args(argv)
+
+    app_module = _import_app()
+    if app_module is None:
         print("fastapi_missing", True)
     else:
-        from spapi_probe.main import app, cron_daily, cron_inventory  # noqa: E402
-        print("app_title", getattr(app, "title", "unknown"))
+        print("app_title", getattr(app_module.app, "title", "unknown"))
     print("bq_dataset", config.BQ_DATASET)
-    _run_spapi_shape_tests()
-    print("spapi_shape_tests", "ok")
-    _run_refresh_token_selection_tests()
-    print("refresh_token_tests", "ok")
-    _run_orders_parse_tests()
-    print("orders_parse_tests", "ok")
-    _run_list_orders_debug_shape_tests()
-    print("list_orders_debug_shape_tests", "ok")
-
-    if fastapi_spec is not None:
-        prev_k_service = os.environ.pop("K_SERVICE", None)
-        try:
-            daily_resp = cron_daily(
-                scope="EU",
-                snapshot_date="2026-01-17",
-                dry=DRY_FALSE,
-                debugItems=0,
-                compact=1,
-                filterMode="Created",
-                maxPages=1,
-                pageSize=1,
-                maxOrders=1,
-            )
-            daily_body = getattr(daily_resp, "body", b"{}")
-            daily_data = json.loads(daily_body.decode("utf-8"))
-            assert daily_data.get("status") == "LOCAL_EXEC_BLOCKED"
-            assert daily_data.get("run_id")
-            assert daily_data.get("stage")
-            assert daily_data.get("error")
-
-            daily_dry_resp = cron_daily(
-                scope="EU",
-                snapshot_date="2026-01-17",
-                dry=DRY_TRUE,
-                debugItems=0,
-                compact=1,
-                filterMode="Created",
-                maxPages=1,
-                pageSize=1,
-                maxOrders=1,
-            )
-            daily_dry_body = getattr(daily_dry_resp, "body", b"{}")
-            daily_dry_data = json.loads(daily_dry_body.decode("utf-8"))
-            assert daily_dry_data.get("status") == "DRY_RUN"
-            assert daily_dry_data.get("run_id")
-
-            inv_resp = cron_inventory(scope="EU", dry=DRY_FALSE)
-            inv_body = getattr(inv_resp, "body", b"{}")
-            inv_data = json.loads(inv_body.decode("utf-8"))
-            assert inv_data.get("status") == "LOCAL_EXEC_BLOCKED"
-            assert inv_data.get("run_id")
-            assert inv_data.get("stage")
-
-            inv_dry_resp = cron_inventory(scope="EU", dry=DRY_TRUE)
-            inv_dry_body = getattr(inv_dry_resp, "body", b"{}")
-            inv_dry_data = json.loads(inv_dry_body.decode("utf-8"))
-            assert inv_dry_data.get("status") == "DRY_RUN"
-            assert inv_dry_data.get("run_id")
-            print("local_block_tests", "ok")
-        finally:
-            if prev_k_service is not None:
-                os.environ["K_SERVICE"] = prev_k_service
+    for label, run_tests in SUITES[args.suite]:
+        print(label, run_tests() or "ok")
 
 
 if __name__ == "__main__":
@@ -1,24 +1,56 @@
 import argparse
 import json
 import os
+import re
 import subprocess
 import sys
 import time
+from itertools import islice
 from typing import Any, Dict, List, Optional
-from urllib.parse import urljoin, urlencode, urlparse
+from urllib.parse import urljoin, urlencode
 
 try:
-    import requests  # type: ignore
+    import orjson  # type: ignore
 except Exception:
-    requests = None  # type: ignore
+    orjson = None  # type: ignore
 
 
 DEFAULT_TIMEOUT = 120
 DEFAULT_RETRIES = 3
+CONNECT_TIMEOUT = 10
+MAX_REDIRECTS = 10
+
+# urllib3.PoolManager once created; False when urllib3 is not installed.
+_HTTP_POOL: Any = None
+
+# Scheme plus authority (host[:port]) of an http(s) URL, case-insensitive like urlparse.
+_URL_RE = re.compile(r"(https?)://([^/?#]*)", re.IGNORECASE)
+
+_REQUIRED_DEBUG_FIELDS = frozenset(
+    {
+        "orders_in_batch",
+        "items_fetched",
+        "items_after_filter",
+        "first_error",
+        "http_status",
+        "spapi_status",
+    }
+)
 
 
 def _emit(payload: Dict[str, Any]) -> None:
-    print(json.dumps(payload, ensure_ascii=False))
+    if orjson is None:
+        print(json.dumps(payload, ensure_ascii=False))
+        return
+    # orjson always emits UTF-8, matching ensure_ascii=False; write it in one go.
+    sys.stdout.buffer.write(orjson.dumps(payload) + b"\n")
+    sys.stdout.flush()
+
+
+def _json_loads(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 def _error_result(error_type: str, message: str, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
@@ -42,10 +74,10 @@ def _coerce_int_status(value: Any) -> Optional[int]:
 def _validate_url(base_url: str) -> Optional[str]:
     if not base_url:
         return "URL is empty"
-    parsed = urlparse(base_url)
-    if parsed.scheme not in ("http", "https"):
+    match = _URL_RE.match(base_url)
+    if match is None:
         return "URL scheme must be http or https"
-    if not parsed.netloc:
+    if not match.group(2):
         return "URL must include host"
     return None
 
@@ -63,23 +95,50 @@ def _build_url(base_url: str, path: str, query_params: Dict[str, Any]) -> str:
     return f"{url}?{qs}" if qs else url
 
 
-def _request_with_requests(
+def _http_pool() -> Any:
+    """
+    Module-level pool so retries reuse the kept-alive connection.
+    urllib3 is imported on first use so fast-fail paths never load it.
+    """
+    global _HTTP_POOL
+    if _HTTP_POOL is None:
+        try:
+            import urllib3  # type: ignore
+        except Exception:
+            _HTTP_POOL = False
+        else:
+            # Retries are handled by _make_request; only follow redirects here.
+            _HTTP_POOL = urllib3.PoolManager(
+                retries=urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=MAX_REDIRECTS)
+            )
+    return _HTTP_POOL or None
+
+
+def _request_with_urllib3(
+    pool: Any,
     url: str,
     headers: Dict[str, str],
-    timeout: int,
+    timeout: float,
 ) -> Dict[str, Any]:
-    response = requests.get(url, headers=headers, timeout=timeout)
+    import urllib3  # type: ignore
+
+    response = pool.request(
+        "GET",
+        url,
+        headers=headers,
+        timeout=urllib3.Timeout(connect=min(CONNECT_TIMEOUT, timeout), read=timeout),
+    )
     return {
-        "http_status": response.status_code,
+        "http_status": response.status,
         "headers": dict(response.headers),
-        "body": response.text,
+        "body": response.data,
     }
 
 
 def _request_with_urllib(
     url: str,
     headers: Dict[str, str],
-    timeout: int,
+    timeout: float,
 ) -> Dict[str, Any]:
     from urllib.request import Request, urlopen
     from urllib.error import HTTPError, URLError
@@ -88,7 +147,7 @@ def _request_with_urllib(
     try:
         with urlopen(req, timeout=timeout) as resp:
             status = getattr(resp, "status", 0) or 0
-            body = resp.read().decode("utf-8", errors="replace")
+            body = resp.read()
             return {
                 "http_status": status,
                 "headers": dict(resp.headers),
@@ -98,7 +157,7 @@ def _request_with_urllib(
         return {
             "http_status": exc.code,
             "headers": dict(getattr(exc, "headers", {}) or {}),
-            "body": exc.read().decode("utf-8", errors="replace") if exc.fp else "",
+            "body": exc.read() if exc.fp else b"",
             "error": str(exc),
         }
     except URLError as exc:
@@ -111,16 +170,24 @@ def _make_request(
     timeout: int,
     retries: int,
 ) -> Dict[str, Any]:
+    """
+    GET url with up to `retries` attempts and exponential backoff.
+    `timeout` is the total wall-clock budget: each attempt gets what is left
+    of it, and no retry is scheduled once the next backoff would overrun it.
+    """
+    deadline = time.monotonic() + timeout
     backoff = 1.0
     last_error: Optional[str] = None
+    pool = _http_pool()
     for attempt in range(retries):
+        remaining = deadline - time.monotonic()
         try:
-            if requests is not None:
-                return _request_with_requests(url, headers, timeout)
-            return _request_with_urllib(url, headers, timeout)
+            if pool is not None:
+                return _request_with_urllib3(pool, url, headers, remaining)
+            return _request_with_urllib(url, headers, remaining)
         except Exception as exc:
             last_error = str(exc)
-            if attempt == retries - 1:
+            if attempt == retries - 1 or time.monotonic() + backoff >= deadline:
                 break
             time.sleep(backoff)
             backoff *= 2
@@ -128,10 +195,7 @@ def _make_request(
 
 
 def _summarize_headers(headers: Dict[str, Any]) -> Dict[str, Any]:
-    summary = {}
-    for key in list(headers.keys())[:20]:
-        summary[key] = headers.get(key)
-    return summary
+    return {key: headers.get(key) for key in islice(headers, 20)}
 
 
 def _assertion(name: str, passed: bool, detail: str) -> Dict[str, Any]:
@@ -150,7 +214,7 @@ def main() -> int:
     parser.add_argument("--max-pages", type=int, default=50, help="Max pages")
     parser.add_argument("--page-size", type=int, default=100, help="Page size")
     parser.add_argument("--max-orders", type=int, default=5000, help="Max orders")
-    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Timeout seconds")
+    parser.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT, help="Total timeout seconds across retries")
     parser.add_argument("--retries", type=int, default=DEFAULT_RETRIES, help="Retry attempts")
     parser.add_argument(
         "--expect-orders-gt-zero",
@@ -197,7 +261,7 @@ def main() -> int:
 
     http_status = response.get("http_status", 0)
     headers_summary = _summarize_headers(response.get("headers") or {})
-    body = response.get("body") or ""
+    body = response.get("body") or b""
 
     if http_status < 200 or http_status >= 300:
         _emit(
@@ -231,7 +295,7 @@ def main() -> int:
         return 1
 
     try:
-        data = json.loads(body)
+        data = _json_loads(body)
     except Exception:
         _emit(
             _error_result(
@@ -242,21 +306,22 @@ def main() -> int:
                     "checked_path": args.path,
                     "query_params": query_params,
                     "http_status": http_status,
-                    "snippet": body[:2000],
+                    "snippet": body.decode("utf-8", errors="replace")[:2000],
                 },
             )
         )
         return 1
 
-    response_ok = bool(data.get("ok"))
-    response_status = data.get("status")
-    response_stage = data.get("stage")
-    response_run_id = data.get("run_id")
-    response_error = data.get("error")
+    get = data.get
+    response_ok = bool(get("ok"))
+    response_status = get("status")
+    response_stage = get("stage")
+    response_run_id = get("run_id")
+    response_error = get("error")
     diagnostics = {
-        "missing_envs": data.get("missing_envs"),
+        "missing_envs": get("missing_envs"),
     }
-    bq_sales_daily_agg = ((data.get("bq") or {}).get("sales_daily_agg") or {})
+    bq_sales_daily_agg = ((get("bq") or {}).get("sales_daily_agg") or {})
     bq_sales_daily_agg_diag = {
         "failed_indexes": bq_sales_daily_agg.get("failed_indexes"),
         "eu_all_failed": bq_sales_daily_agg.get("eu_all_failed"),
@@ -286,14 +351,14 @@ def main() -> int:
             )
         )
         return 1
-    orders_count = data.get("orders_count")
-    units_sold = data.get("units_sold")
-    items_rows_count = data.get("items_rows_count")
-    asin_stats_count = data.get("asin_stats_count")
+    orders_count = get("orders_count")
+    units_sold = get("units_sold")
+    items_rows_count = get("items_rows_count")
+    asin_stats_count = get("asin_stats_count")
 
     assertions: List[Dict[str, Any]] = []
-    debug_required = bool(args.debug_items) or bool(args.compact == 0)
-    debug = data.get("debug") or {}
+    debug_required = bool(args.debug_items) or args.compact == 0
+    debug = get("debug") or {}
     order_items_by_country = debug.get("order_items_by_country")
 
     if debug_required:
@@ -306,30 +371,30 @@ def main() -> int:
             )
         )
         if has_debug:
-            required_fields = {
-                "orders_in_batch",
-                "items_fetched",
-                "items_after_filter",
-                "first_error",
-                "http_status",
-                "spapi_status",
-            }
             for country, entry in order_items_by_country.items():
-                missing = [k for k in required_fields if k not in (entry or {})]
+                present = entry.keys() if isinstance(entry, dict) else ()
+                missing = _REQUIRED_DEBUG_FIELDS.difference(present)
                 assertions.append(
                     _assertion(
                         f"debug_fields_{country}",
                         not missing,
-                        "ok" if not missing else f"missing {', '.join(missing)}",
+                        "ok" if not missing else f"missing {', '.join(sorted(missing))}",
                     )
                 )
 
     if isinstance(order_items_by_country, dict):
         items_sum = 0
         for entry in order_items_by_country.values():
+            if not isinstance(entry, dict):
+                continue
+            value = entry.get("items_after_filter")
+            if type(value) is int:
+                items_sum += value
+                continue
+            # Rare non-int values (None, numeric strings) take the slow path.
             try:
-                items_sum += int(entry.get("items_after_filter") or 0)
-            except Exception:
+                items_sum += int(value or 0)
+            except (TypeError, ValueError):
                 pass
         if units_sold is not None:
             assertions.append(
@@ -351,7 +416,7 @@ def main() -> int:
             )
         )
 
-    ok = all(a.get("passed") for a in assertions) if assertions else True
+    ok = not any(not a["passed"] for a in assertions)
     result = {
         "ok": ok,
         "checked_url": args.url,
@@ -1,37 +1,194 @@
 from __future__ import annotations
 
-from typing import Iterable, List, Dict, Set
+import functools
+import io
+import random
+import threading
+import time
+import uuid
+from typing import Any, Callable, FrozenSet, Iterable, List, Dict, Optional, Tuple, TypeVar
 from datetime import date
+from google.api_core import exceptions as gexc
 from google.cloud import bigquery
 
+from .config import BQ_INSERT_BATCH, BQ_MAX_BYTES_BILLED
+from .utils_json import dumps_bytes
+
 
 DATASET = "amazon_ops"
 TABLE_CHECKPOINT = f"{DATASET}.etl_orders_checkpoint"
 TABLE_FACT_ORDER_ASIN = f"{DATASET}.fact_sales_order_asin"
 
+# 5xx (incl. ServiceUnavailable) and 429 rate limits are transient; everything else fails fast.
+_RETRYABLE_BQ_ERRORS = (gexc.ServerError, gexc.TooManyRequests)
+
+T = TypeVar("T")
+
+# Processed order ids per (snapshot_date, scope); repeat lookups within a run skip the query job.
+_CHECKPOINT_TTL_SEC = 300.0
+_CHECKPOINT_CACHE_MAX = 128
+_CHECKPOINT_CACHE: Dict[Tuple[date, str], Tuple[float, FrozenSet[str]]] = {}
+_CHECKPOINT_LOCK = threading.Lock()
 
+
+@functools.lru_cache(maxsize=1)
 def bq_client() -> bigquery.Client:
     # Cloud Run 默认用服务账号的 ADC
+    # One client per process: credential discovery and the HTTP transport are reused across calls.
     return bigquery.Client()
 
 
-def fetch_processed_order_ids(snapshot_date: date, scope: str) -> Set[str]:
+def retry_bq(fn: Callable[[], T], *, max_tries: int = 3, base_sleep: float = 1.0, max_sleep: float = 30.0) -> T:
+    """Retry a BigQuery call on transient errors with capped exponential backoff plus jitter."""
+    for i in range(max_tries):
+        try:
+            return fn()
+        except _RETRYABLE_BQ_ERRORS:
+            if i == max_tries - 1:
+                raise
+            time.sleep(min(max_sleep, base_sleep * (2 ** i)) * (1 + random.random() * 0.5))
+    raise RuntimeError("BigQuery retry exhausted")
+
+
+def insert_rows_with_retry(client: bigquery.Client, table_id: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    insert_rows_json wrapped in retry_bq.
+    insertIds are fixed before the first attempt so a retried request is deduplicated by BigQuery.
+    The client's own retry (DEFAULT_RETRY, ~600 s deadline) is turned off so retry_bq is the only retry layer.
+    """
+    row_ids = [str(uuid.uuid4()) for _ in rows]
+    return retry_bq(lambda: client.insert_rows_json(table_id, rows, row_ids=row_ids, retry=None))
+
+
+def load_rows_json(client: bigquery.Client, table_id: str, rows: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """
+    Append rows with one NEWLINE_DELIMITED_JSON load job and wait for it.
+    No streaming quota or fees, and the job is atomic: every row lands or none do.
+    Returns None once the job committed, or its error_result if the job finished failed (nothing was written).
+    Any other GoogleAPICallError (upload or polling failed) is raised: the job may still commit, so do not resend.
+    """
+    buf = io.BytesIO(b"".join(dumps_bytes(r) + b"\n" for r in rows))
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    job = client.load_table_from_file(buf, table_id, job_config=job_config)
+    try:
+        job.result()
+    except gexc.GoogleAPICallError:
+        if job.state == "DONE" and job.error_result:
+            return job.error_result
+        raise
+    return None
+
+
+def insert_rows_chunked(
+    client: bigquery.Client,
+    table_id: str,
+    rows: List[Dict[str, Any]],
+    batch_size: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Stream rows with one insert_rows_json request per batch_size rows (default BQ_INSERT_BATCH).
+    Returns the combined row errors; each error "index" is relative to `rows`, not to its chunk.
+    """
+    size = max(1, batch_size or BQ_INSERT_BATCH)
+    errors: List[Dict[str, Any]] = []
+    for start in range(0, len(rows), size):
+        chunk_errors = insert_rows_with_retry(client, table_id, rows[start:start + size])
+        for e in chunk_errors or []:
+            if start and isinstance(e, dict) and "index" in e:
+                e = {**e, "index": e["index"] + start}
+            errors.append(e)
+    return errors
+
+
+class BufferedRowWriter:
+    """
+    Streams rows into one table as they are produced, one insert request per flush_every rows.
+    Rows are dicts or NamedTuples (buffered as-is, turned into dicts at flush time).
+    `const` fields (run_id, ingested_at, ...) are merged into every row; add() is thread-safe.
+    """
+
+    def __init__(
+        self,
+        client: bigquery.Client,
+        table_id: str,
+        *,
+        const: Optional[Dict[str, Any]] = None,
+        flush_every: Optional[int] = None,
+    ) -> None:
+        self.client = client
+        self.table_id = table_id
+        self.const = const or {}
+        self.flush_every = max(1, flush_every or BQ_INSERT_BATCH)
+        self.count = 0
+        self.errors: List[Dict[str, Any]] = []
+        self._buf: List[Any] = []
+        self._lock = threading.Lock()
+
+    def add(self, row: Any) -> None:
+        with self._lock:
+            self._buf.append(row)
+            if len(self._buf) >= self.flush_every:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def discard(self) -> None:
+        """Drop rows not flushed yet; rows from earlier flushes are already in the table."""
+        with self._lock:
+            self._buf = []
+
+    def _flush_locked(self) -> None:
+        if not self._buf:
+            return
+        const = self.const
+        rows = [{**const, **(r._asdict() if isinstance(r, tuple) else r)} for r in self._buf]
+        self._buf = []
+        # Error indexes are reported relative to everything written through this writer
+        for e in insert_rows_with_retry(self.client, self.table_id, rows) or []:
+            if self.count and isinstance(e, dict) and "index" in e:
+                e = {**e, "index": e["index"] + self.count}
+            self.errors.append(e)
+        self.count += len(rows)
+
+
+def fetch_processed_order_ids(snapshot_date: date, scope: str) -> FrozenSet[str]:
+    key = (snapshot_date, scope)
+    now = time.monotonic()
+    with _CHECKPOINT_LOCK:
+        hit = _CHECKPOINT_CACHE.get(key)
+        if hit and hit[0] > now:
+            return hit[1]
+
     client = bq_client()
     q = f"""
       SELECT order_id
       FROM `{TABLE_CHECKPOINT}`
       WHERE snapshot_date = @d AND scope = @s
     """
-    job = client.query(
-        q,
-        job_config=bigquery.QueryJobConfig(
-            query_parameters=[
-                bigquery.ScalarQueryParameter("d", "DATE", snapshot_date.isoformat()),
-                bigquery.ScalarQueryParameter("s", "STRING", scope),
-            ]
-        ),
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("d", "DATE", snapshot_date),
+            bigquery.ScalarQueryParameter("s", "STRING", scope),
+        ],
+        use_query_cache=True,
+        maximum_bytes_billed=BQ_MAX_BYTES_BILLED,
     )
-    return {row["order_id"] for row in job.result()}
+
+    def _run() -> FrozenSet[str]:
+        job = client.query(q, job_config=job_config)
+        return frozenset(row["order_id"] for row in job.result())
+
+    ids = retry_bq(_run)
+    with _CHECKPOINT_LOCK:
+        if len(_CHECKPOINT_CACHE) >= _CHECKPOINT_CACHE_MAX:
+            _CHECKPOINT_CACHE.clear()
+        _CHECKPOINT_CACHE[key] = (time.monotonic() + _CHECKPOINT_TTL_SEC, ids)
+    return ids
 
 
 def mark_orders_processed(rows: List[Dict]) -> None:
@@ -40,8 +197,10 @@ def mark_orders_processed(rows: List[Dict]) -> None:
     """
     if not rows:
         return
-    client = bq_client()
-    errors = client.insert_rows_json(TABLE_CHECKPOINT, rows)
+    errors = insert_rows_chunked(bq_client(), TABLE_CHECKPOINT, rows)
+    # New checkpoints make cached id sets stale
+    with _CHECKPOINT_LOCK:
+        _CHECKPOINT_CACHE.clear()
     if errors:
         raise RuntimeError(f"BigQuery insert checkpoint errors: {errors}")
 
@@ -52,7 +211,6 @@ def insert_fact_sales_order_asin(rows: List[Dict]) -> None:
     """
     if not rows:
         return
-    client = bq_client()
-    errors = client.insert_rows_json(TABLE_FACT_ORDER_ASIN, rows)
+    errors = insert_rows_chunked(bq_client(), TABLE_FACT_ORDER_ASIN, rows)
     if errors:
         raise RuntimeError(f"BigQuery insert fact_sales_order_asin errors: {errors}")
\ No newline at end of file
@@ -1,5 +1,6 @@
+import functools
 import os
-from typing import Dict, List, Tuple
+from typing import Dict, Tuple
 
 # ---- SP-API / LWA ----
 LWA_CLIENT_ID = os.getenv("LWA_CLIENT_ID", "")
@@ -42,6 +43,11 @@ MARKETPLACES: Dict[str, Dict[str, str]] = {
     },
 }
 
+# Reverse lookup (scope -> marketplace_id -> country) for per-order country resolution
+_MP_TO_COUNTRY: Dict[str, Dict[str, str]] = {
+    scope: {mid: cc for cc, mid in mp.items()} for scope, mp in MARKETPLACES.items()
+}
+
 # Timezone used to build the daily window
 SCOPE_TZ = {
     "EU": "Europe/Berlin",
@@ -63,6 +69,18 @@ BQ_TABLE_SALES_ASIN_DAILY = os.getenv("BQ_TABLE_SALES_ASIN_DAILY", "probe_sales_
 BQ_TABLE_INV_FBA_ASIN = os.getenv("BQ_TABLE_INV_FBA_ASIN", "probe_inventory_fba_asin_v1")
 BQ_TABLE_INV_AWD_ASIN = os.getenv("BQ_TABLE_INV_AWD_ASIN", "probe_inventory_awd_asin_v1")
 
+# Rows per insert_rows_json request (BigQuery recommends ~500 per streaming insert)
+BQ_INSERT_BATCH = int(os.getenv("BQ_INSERT_BATCH", "500"))
+
+# Batches larger than this go through an NDJSON load job instead of streaming inserts
+BQ_LOAD_JOB_THRESHOLD = int(os.getenv("BQ_LOAD_JOB_THRESHOLD", "500"))
+
+# Store the raw SP-API item JSON in inventory raw_json_str (0 = write "" to save serialization and storage)
+INVENTORY_KEEP_RAW = os.getenv("INVENTORY_KEEP_RAW", "1") == "1"
+
+# Upper bound on bytes billed per lookup query; a runaway scan fails instead of costing money
+BQ_MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES_BILLED", str(10 * 1024 ** 3)))
+
 
 def get_bq_table_id(table_name: str) -> str:
     if not BQ_PROJECT:
@@ -89,23 +107,27 @@ def bq_inv_fba_asin_table_id() -> str:
 def bq_inv_awd_asin_table_id() -> str:
     return get_bq_table_id(BQ_TABLE_INV_AWD_ASIN)
 
+# Scope accessors are cached: inputs are a handful of scope strings and the tables above are static.
+@functools.lru_cache(maxsize=8)
 def marketplaces_for_scope(scope: str) -> Dict[str, str]:
     s = scope.upper()
     if s not in MARKETPLACES:
         raise ValueError(f"Unknown scope: {scope}")
     return MARKETPLACES[s]
 
-def marketplace_ids_for_scope(scope: str) -> List[str]:
+@functools.lru_cache(maxsize=8)
+def marketplace_ids_for_scope(scope: str) -> Tuple[str, ...]:
+    # Cached, so return an immutable tuple rather than a shared list
     mp = marketplaces_for_scope(scope)
-    return list(mp.values())
+    return tuple(mp.values())
 
 def country_for_marketplace_id(scope: str, marketplace_id: str) -> str:
-    mp = marketplaces_for_scope(scope)
-    for cc, mid in mp.items():
-        if mid == marketplace_id:
-            return cc
-    return "UNK"
+    s = scope.upper()
+    if s not in _MP_TO_COUNTRY:
+        raise ValueError(f"Unknown scope: {scope}")
+    return _MP_TO_COUNTRY[s].get(marketplace_id, "UNK")
 
+@functools.lru_cache(maxsize=8)
 def endpoint_for_scope(scope: str) -> str:
     s = scope.upper()
     if s == "UK":
@@ -115,9 +137,13 @@ def endpoint_for_scope(scope: str) -> str:
         raise ValueError(f"Unknown scope: {scope}")
     return SPAPI_ENDPOINTS[s]
 
+@functools.lru_cache(maxsize=8)
 def tz_for_scope(scope: str) -> str:
     return SCOPE_TZ.get(scope.upper(), "UTC")
 
+# Env is fixed once the Cloud Run instance has booted, so evaluate it once per process.
+# Callers must not mutate the returned checks dict (it is shared).
+@functools.lru_cache(maxsize=1)
 def require_env() -> Tuple[bool, Dict[str, bool]]:
     lwa_client_id = os.getenv("LWA_CLIENT_ID", "")
     lwa_client_secret = os.getenv("LWA_CLIENT_SECRET", "")
@@ -1,21 +1,22 @@
 from __future__ import annotations
 
-import json
 import uuid
-import time
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date
-from typing import Any, Dict, List, Optional
-
-from google.cloud import bigquery
+from typing import Any, Callable, Dict, Iterator, NamedTuple, Optional, Union
 
+from .bq import BufferedRowWriter, bq_client
 from .config import (
+    INVENTORY_KEEP_RAW,
     bq_inv_fba_asin_table_id,
     bq_inv_awd_asin_table_id,
     marketplaces_for_scope,
     tz_for_scope,
 )
-from .spapi_core import spapi_request_json, SpapiRequestError
+from .spapi_core import retry_spapi, spapi_request_json, SpapiRequestError
+from .utils_json import dumps_str
+from .utils_rate import pacer_for, rate_limit_from_debug
 
 logger = logging.getLogger("spapi_inventory")
 
@@ -30,48 +31,141 @@ INV_POOL_MAP = {
     "US": "ATVPDKIKX0DER",
 }
 
-def _retry_spapi(fn, *, stage: str, run_id: str, max_tries: int = 4, base_sleep: float = 1.0):
-    last_exc: Optional[Exception] = None
-    for i in range(max_tries):
+# Documented default rates (requests/sec); replaced by x-amzn-RateLimit-Limit once a response reports it
+FBA_SUMMARIES_RATE = 2.0
+AWD_INVENTORY_RATE = 2.0
+
+# Row shapes match the BigQuery columns minus the per-run run_id/ingested_at/snapshot_date
+class FbaRow(NamedTuple):
+    inv_pool: str
+    asin: Optional[str]
+    marketplace_id: str
+    qty_available: int
+    qty_inbound: int
+    qty_reserved_total: int
+    qty_reserved_customer_orders: int
+    qty_reserved_effective: int
+    raw_json_str: str
+
+class AwdRow(NamedTuple):
+    inv_pool: str
+    asin: Optional[str]
+    qty_available: int
+    qty_inbound: int
+    raw_json_str: str
+
+InventoryRow = Union[FbaRow, AwdRow]
+RowSink = Callable[[InventoryRow], None]
+
+def _discard(row: InventoryRow) -> None:
+    pass
+
+def _retry_spapi(fn, *, stage: str, run_id: str):
+    return retry_spapi(fn, stage=stage, run_id=run_id, max_tries=4, base_sleep=1.0)
+
+def _iter_fba_pool(pool: str, api_scope: str, run_id: str) -> Iterator[FbaRow]:
+    """Pages through FBA inventory summaries for one pool, yielding rows as each page arrives."""
+    mp_id = INV_POOL_MAP.get(pool)
+    if not mp_id:
+        return
+
+    # Call FBA Inventory API
+    # GET /fba/inventory/v1/summaries
+    # One params dict reused across pages; only nextToken changes
+    q = {
+        "details": "true",
+        "granularityType": "Marketplace",
+        "granularityId": mp_id,
+        "marketplaceIds": mp_id
+    }
+
+    next_token = None
+    page_count = 0
+    pacer = pacer_for(api_scope, "/fba/inventory/v1/summaries", FBA_SUMMARIES_RATE)
+
+    def _call():
+        return spapi_request_json(
+            scope=api_scope,
+            method="GET",
+            path="/fba/inventory/v1/summaries",
+            query=q
+        )
+
+    while True:
+        if next_token:
+            q["nextToken"] = next_token
+
         try:
-            resp = fn()
-            if isinstance(resp, dict) and not resp.get("ok", False):
-                status = int(resp.get("status") or 0)
-                err = SpapiRequestError(
-                    message=resp.get("error") or "SP-API request failed",
-                    status=status,
-                    stage=stage,
-                    run_id=run_id,
-                    debug=resp.get("debug") or {},
+            pacer.wait()
+            resp = _retry_spapi(_call, stage="fba_summary", run_id=run_id)
+            pacer.update_rate(rate_limit_from_debug(resp.get("debug")))
+            payload = resp.get("payload") or {}
+            summaries = payload.get("inventorySummaries") or []
+
+            for item in summaries:
+                asin = item.get("asin")
+                details = item.get("inventoryDetails") or {}
+
+                reserved = details.get("reservedQuantity") or {}
+
+                qty_total_reserved = int(reserved.get("totalReservedQuantity") or 0)
+                qty_reserved_cust = int(reserved.get("pendingCustomerOrderQuantity") or 0)
+
+                # Effective reserved = Total - CustomerOrders
+                # (Logic: items reserved for orders are effectively sold, items reserved for transfer/processing are internal stock)
+                qty_reserved_eff = max(0, qty_total_reserved - qty_reserved_cust)
+
+                qty_avail = int(details.get("fulfillableQuantity") or 0)
+
+                inbound = details.get("inboundQuantity") or {} # Note: API structure might vary slightly, checking generic
+                # Actually API usually returns inboundWorkingQuantity, inboundShippedQuantity etc at top level of inventoryDetails?
+                # Let's check typical structure:
+                # inventoryDetails: { fulfillableQuantity, inboundWorkingQuantity, inboundShippedQuantity, inboundReceivingQuantity ... }
+
+                qty_inbound = (
+                    int(details.get("inboundWorkingQuantity") or 0) +
+                    int(details.get("inboundShippedQuantity") or 0) +
+                    int(details.get("inboundReceivingQuantity") or 0)
+                )
+
+                yield FbaRow(
+                    inv_pool=pool,
+                    asin=asin,
+                    marketplace_id=mp_id,
+                    qty_available=qty_avail,
+                    qty_inbound=qty_inbound,
+                    qty_reserved_total=qty_total_reserved,
+                    qty_reserved_customer_orders=qty_reserved_cust,
+                    qty_reserved_effective=qty_reserved_eff,
+                    raw_json_str=dumps_str(item) if INVENTORY_KEEP_RAW else ""
                 )
-                if status in (429, 503, 504):
-                    last_exc = err
-                    time.sleep(base_sleep * (2 ** i))
-                    continue
-                raise err
-            return resp
-        except SpapiRequestError as e:
-            last_exc = e
-            if e.status in (429, 503, 504) and i < max_tries - 1:
-                time.sleep(base_sleep * (2 ** i))
-                continue
+
+            next_token = payload.get("nextToken")
+            page_count += 1
+            if not next_token:
+                break
+
+        except SpapiRequestError:
             raise
         except Exception as e:
-            last_exc = e
+            logger.error(dumps_str({"event": "fba_fetch_error", "pool": pool, "error": str(e), "run_id": run_id}))
             raise
-    if last_exc:
-        raise last_exc
-    raise RuntimeError("SP-API retry exhausted")
 
-def fetch_fba_inventory(scope: str, run_id: str) -> List[Dict[str, Any]]:
+def _drain(rows: Iterator[InventoryRow], sink: RowSink) -> int:
+    n = 0
+    for row in rows:
+        sink(row)
+        n += 1
+    return n
+
+def fetch_fba_inventory(scope: str, run_id: str, sink: RowSink = _discard) -> int:
     """
-    Fetches FBA inventory summaries.
+    Fetches FBA inventory summaries, passing each row to `sink` as pages arrive.
+    Returns the number of rows fetched.
     Determines which Pools to fetch based on Scope.
     EU Scope -> Fetches DE and UK pools.
     NA Scope -> Fetches US pool.
     """
-    rows = []
-    
     pools_to_fetch = []
     if scope == "EU":
         pools_to_fetch = ["DE", "UK"]
@@ -80,131 +174,55 @@ def fetch_fba_inventory(scope: str, run_id: str) -> List[Dict[str, Any]]:
     elif scope == "NA":
         pools_to_fetch = ["US"]
     
-    logger.info(json.dumps({"event": "fetch_fba_start", "scope": scope, "pools": pools_to_fetch, "run_id": run_id}))
+    logger.info(dumps_str({"event": "fetch_fba_start", "scope": scope, "pools": pools_to_fetch, "run_id": run_id}))
 
-    for pool in pools_to_fetch:
-        mp_id = INV_POOL_MAP.get(pool)
-        if not mp_id:
-            continue
-            
-        # Call FBA Inventory API
-        # GET /fba/inventory/v1/summaries
-        query = {
-            "details": "true",
-            "granularityType": "Marketplace",
-            "granularityId": mp_id,
-            "marketplaceIds": mp_id
-        }
-        
-        # Determine API region from scope (EU/NA)
-        api_scope = "EU" if pool in ("DE", "UK") else "NA"
-        
-        next_token = None
-        page_count = 0
-        
-        while True:
-            q = query.copy()
-            if next_token:
-                q["nextToken"] = next_token
-                
-            def _call():
-                return spapi_request_json(
-                    scope=api_scope,
-                    method="GET",
-                    path="/fba/inventory/v1/summaries",
-                    query=q
-                )
-            
-            try:
-                resp = _retry_spapi(_call, stage="fba_summary", run_id=run_id)
-                payload = resp.get("payload") or {}
-                summaries = payload.get("inventorySummaries") or []
-                
-                for item in summaries:
-                    asin = item.get("asin")
-                    details = item.get("inventoryDetails") or {}
-                    
-                    reserved = details.get("reservedQuantity") or {}
-                    
-                    qty_total_reserved = int(reserved.get("totalReservedQuantity") or 0)
-                    qty_reserved_cust = int(reserved.get("pendingCustomerOrderQuantity") or 0)
-                    
-                    # Effective reserved = Total - CustomerOrders
-                    # (Logic: items reserved for orders are effectively sold, items reserved for transfer/processing are internal stock)
-                    qty_reserved_eff = max(0, qty_total_reserved - qty_reserved_cust)
-                    
-                    qty_avail = int(details.get("fulfillableQuantity") or 0)
-                    
-                    inbound = details.get("inboundQuantity") or {} # Note: API structure might vary slightly, checking generic
-                    # Actually API usually returns inboundWorkingQuantity, inboundShippedQuantity etc at top level of inventoryDetails?
-                    # Let's check typical structure:
-                    # inventoryDetails: { fulfillableQuantity, inboundWorkingQuantity, inboundShippedQuantity, inboundReceivingQuantity ... }
-                    
-                    qty_inbound = (
-                        int(details.get("inboundWorkingQuantity") or 0) +
-                        int(details.get("inboundShippedQuantity") or 0) +
-                        int(details.get("inboundReceivingQuantity") or 0)
-                    )
-
-                    rows.append({
-                        "inv_pool": pool,
-                        "asin": asin,
-                        "marketplace_id": mp_id,
-                        "qty_available": qty_avail,
-                        "qty_inbound": qty_inbound,
-                        "qty_reserved_total": qty_total_reserved,
-                        "qty_reserved_customer_orders": qty_reserved_cust,
-                        "qty_reserved_effective": qty_reserved_eff,
-                        "raw_json_str": json.dumps(item)
-                    })
-                
-                next_token = payload.get("nextToken")
-                page_count += 1
-                if not next_token:
-                    break
-                time.sleep(0.1) # Pace
-                
-            except SpapiRequestError:
-                raise
-            except Exception as e:
-                logger.error(json.dumps({"event": "fba_fetch_error", "pool": pool, "error": str(e), "run_id": run_id}))
-                raise
-                
-    return rows
+    # Pools are independent SP-API calls, so fetch them concurrently; API region (EU/NA) follows the pool.
+    # Pools in one region share that region's pacer, so concurrency does not raise the request rate.
+    with ThreadPoolExecutor(max_workers=max(1, len(pools_to_fetch))) as ex:
+        futures = [
+            ex.submit(_drain, _iter_fba_pool(pool, "EU" if pool in ("DE", "UK") else "NA", run_id), sink)
+            for pool in pools_to_fetch
+        ]
+        return sum(f.result() for f in futures)
 
-def fetch_awd_inventory(scope: str, run_id: str) -> List[Dict[str, Any]]:
+def fetch_awd_inventory(scope: str, run_id: str, sink: RowSink = _discard) -> int:
     """
-    Fetches AWD inventory (US only).
+    Fetches AWD inventory (US only), passing each row to `sink` as pages arrive.
+    Returns the number of rows fetched.
     """
     if scope != "NA":
-        return []
-        
-    rows = []
-    logger.info(json.dumps({"event": "fetch_awd_start", "run_id": run_id}))
+        return 0
+    return _drain(_iter_awd_inventory(run_id), sink)
+
+def _iter_awd_inventory(run_id: str) -> Iterator[AwdRow]:
+    logger.info(dumps_str({"event": "fetch_awd_start", "run_id": run_id}))
     
     # AWD endpoint: /awd/2024-05-09/inventory
-    query = {
+    # One params dict reused across pages; only nextToken changes
+    q = {
         "details": "SHOW", # Often required to get breakdown
         "maxResults": "100"
     }
     
     next_token = None
+    pacer = pacer_for("NA", "/awd/2024-05-09/inventory", AWD_INVENTORY_RATE)
+
+    def _call():
+        return spapi_request_json(
+            scope="NA",
+            method="GET",
+            path="/awd/2024-05-09/inventory",
+            query=q
+        )
     
     while True:
-        q = query.copy()
         if next_token:
             q["nextToken"] = next_token
             
-        def _call():
-            return spapi_request_json(
-                scope="NA",
-                method="GET",
-                path="/awd/2024-05-09/inventory",
-                query=q
-            )
-            
         try:
+            pacer.wait()
             resp = _retry_spapi(_call, stage="awd_summary", run_id=run_id)
+            pacer.update_rate(rate_limit_from_debug(resp.get("debug")))
             payload = resp.get("payload") or {}
             listings = payload.get("listingInventory") or []
             
@@ -218,83 +236,41 @@ def fetch_awd_inventory(scope: str, run_id: str) -> List[Dict[str, Any]]:
                 # Inbound is not always explicit in AWD list response, might be derived
                 # For now map available.
                 
-                rows.append({
-                    "inv_pool": "US_AWD",
-                    "asin": asin,
-                    "qty_available": qty_avail,
-                    "qty_inbound": 0, # Placeholder if not in resp
-                    "raw_json_str": json.dumps(item)
-                })
+                yield AwdRow(
+                    inv_pool="US_AWD",
+                    asin=asin,
+                    qty_available=qty_avail,
+                    qty_inbound=0, # Placeholder if not in resp
+                    raw_json_str=dumps_str(item) if INVENTORY_KEEP_RAW else ""
+                )
                 
             next_token = payload.get("nextToken")
             if not next_token:
                 break
-            time.sleep(0.1)
             
         except SpapiRequestError:
             raise
         except Exception as e:
             # AWD might not be active or authorized, log and skip
-            logger.error(json.dumps({"event": "awd_fetch_error", "error": str(e), "run_id": run_id}))
+            logger.error(dumps_str({"event": "awd_fetch_error", "error": str(e), "run_id": run_id}))
             raise
 
-    return rows
-
-def write_inventory_bq(
+def open_inventory_writers(
     run_id: str,
     snapshot_date: date,
-    fba_rows: List[Dict],
-    awd_rows: List[Dict],
-    dry: bool
-):
-    if dry:
-        return {"dry": True}
-        
-    client = bigquery.Client()
-    ingested_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-    results = {}
-    
-    # 1. FBA
-    fba_bq = []
-    for r in fba_rows:
-        fba_bq.append({
-            "run_id": run_id,
-            "ingested_at": ingested_at,
-            "snapshot_date": str(snapshot_date),
-            "inv_pool": r["inv_pool"],
-            "asin": r["asin"],
-            "marketplace_id": r["marketplace_id"],
-            "qty_available": r["qty_available"],
-            "qty_inbound": r["qty_inbound"],
-            "qty_reserved_total": r["qty_reserved_total"],
-            "qty_reserved_customer_orders": r["qty_reserved_customer_orders"],
-            "qty_reserved_effective": r["qty_reserved_effective"],
-            "raw_json_str": r["raw_json_str"]
-        })
-    
-    if fba_bq:
-        errors = client.insert_rows_json(bq_inv_fba_asin_table_id(), fba_bq)
-        results["fba"] = {"inserted": len(fba_bq), "errors": errors}
-        
-    # 2. AWD
-    awd_bq = []
-    for r in awd_rows:
-        awd_bq.append({
-            "run_id": run_id,
-            "ingested_at": ingested_at,
-            "snapshot_date": str(snapshot_date),
-            "inv_pool": r["inv_pool"],
-            "asin": r["asin"],
-            "qty_available": r["qty_available"],
-            "qty_inbound": r["qty_inbound"],
-            "raw_json_str": r["raw_json_str"]
-        })
-
-    if awd_bq:
-        errors = client.insert_rows_json(bq_inv_awd_asin_table_id(), awd_bq)
-        results["awd"] = {"inserted": len(awd_bq), "errors": errors}
-        
-    return results
+    ingested_at: str,
+) -> Dict[str, BufferedRowWriter]:
+    client = bq_client()
+    # Per-run constants, formatted once and merged into every row by the writer
+    const = {
+        "run_id": run_id,
+        "ingested_at": ingested_at,
+        "snapshot_date": str(snapshot_date),
+    }
+    return {
+        "fba": BufferedRowWriter(client, bq_inv_fba_asin_table_id(), const=const),
+        "awd": BufferedRowWriter(client, bq_inv_awd_asin_table_id(), const=const),
+    }
 
 def run_inventory(
     scope: str,
@@ -302,20 +278,49 @@ def run_inventory(
     dry: bool = True
 ) -> Dict[str, Any]:
     run_id = str(uuid.uuid4())
-    snapshot_date = datetime.utcnow().date() # Inventory is "Snapshot of Now"
-    
-    logger.info(json.dumps({"event": "run_inventory_start", "run_id": run_id, "scope": scope}))
+    now = datetime.utcnow()
+    snapshot_date = now.date() # Inventory is "Snapshot of Now"
+    ingested_at = now.isoformat(timespec="seconds") + "Z"
     
-    fba_rows = fetch_fba_inventory(scope, run_id)
-    awd_rows = fetch_awd_inventory(scope, run_id)
+    logger.info(dumps_str({"event": "run_inventory_start", "run_id": run_id, "scope": scope}))
     
-    bq_res = write_inventory_bq(run_id, snapshot_date, fba_rows, awd_rows, dry)
+    # Rows stream into BigQuery while pages are still being fetched (dry run just counts them)
+    writers = {} if dry else open_inventory_writers(run_id, snapshot_date, ingested_at)
+    fba_sink = writers["fba"].add if writers else _discard
+    awd_sink = writers["awd"].add if writers else _discard
+
+    # FBA and AWD use different endpoints and quotas; fetch them side by side
+    awd_error: Optional[Dict[str, Any]] = None
+    with ThreadPoolExecutor(max_workers=2) as ex:
+        fba_fut = ex.submit(fetch_fba_inventory, scope, run_id, fba_sink)
+        awd_fut = ex.submit(fetch_awd_inventory, scope, run_id, awd_sink)
+        fba_count = fba_fut.result()
+        try:
+            awd_count = awd_fut.result()
+        except Exception as e:
+            # AWD is often not enabled/authorized for the account; keep the FBA snapshot.
+            # Unflushed AWD rows are dropped; rows from earlier flushes stay and are reported as a partial snapshot.
+            if writers:
+                writers["awd"].discard()
+            awd_count = writers["awd"].count if writers else 0
+            awd_error = e.to_dict() if isinstance(e, SpapiRequestError) else {"error": str(e)}
+            logger.error(dumps_str({"event": "awd_skipped", "error": str(e), "awd_rows_written": awd_count, "run_id": run_id}))
+
+    bq_res: Dict[str, Any] = {"dry": True} if dry else {}
+    for name, writer in writers.items():
+        writer.flush()
+        if writer.count:
+            bq_res[name] = {"inserted": writer.count, "errors": writer.errors}
     
-    return {
+    out = {
         "run_id": run_id,
         "scope": scope,
         "ok": True,
-        "fba_rows_count": len(fba_rows),
-        "awd_rows_count": len(awd_rows),
+        "fba_rows_count": fba_count,
+        "awd_rows_count": awd_count,
         "bq": bq_res
     }
+    if awd_error:
+        out["awd_error"] = awd_error
+        out["awd_partial"] = awd_count > 0
+    return out
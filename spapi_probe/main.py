@@ -1,38 +1,69 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import uuid
 import logging
 import os
 import sys
-import json
+import traceback
+from contextlib import asynccontextmanager
 from datetime import date as date_type
-from typing import Optional
+from typing import Optional, Sequence
 
 from fastapi import FastAPI, Query
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse
 
-from .config import require_env, tz_for_scope
+from .config import MARKETPLACES, require_env, tz_for_scope
 from .utils_env import get_missing_required_envs
+from .utils_json import HAVE_ORJSON
+from .utils_log import install_json_formatter
 from .spapi_core import SpapiRequestError
 from .utils_time import yesterday_local
 from .orders_agg import run_daily, fetch_orders_for_scope
 from .inventory_probe import run_inventory
 
-# Configure startup logging
+# Configure startup logging (StreamHandler flushes every record; the image also sets PYTHONUNBUFFERED=1)
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+install_json_formatter(logging.getLogger())
 logger = logging.getLogger("spapi_main")
 logger.info("Service Initializing...")
 
-app = FastAPI()
+# orjson renders large aggregate payloads several times faster than stdlib json
+AppJSONResponse = ORJSONResponse if HAVE_ORJSON else JSONResponse
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logger.info("Service Startup Complete")
+    yield
+
+app = FastAPI(lifespan=lifespan, default_response_class=AppJSONResponse)
+
+_VALID_SCOPES = frozenset(MARKETPLACES)
 
 LOCAL_BLOCKED_STATUS = "LOCAL_EXEC_BLOCKED"
 DRY_RUN_STATUS = "DRY_RUN"
 
+# Static parts of the dry-run payloads, shared across requests
+_DAILY_DRY_STEPS = (
+    "Fetch orders list (paginated)",
+    "Fetch order items for each order",
+    "Aggregate orders/items/ASIN stats",
+    "Write results to BigQuery (skipped in dry run)",
+)
+_INVENTORY_DRY_STEPS = (
+    "Fetch FBA inventory summaries",
+    "Fetch AWD inventory (NA only)",
+    "Write inventory snapshots to BigQuery (skipped in dry run)",
+)
+
+# K_SERVICE is set by Cloud Run at instance start and never changes afterwards
+@functools.lru_cache(maxsize=1)
 def _is_cloud_run() -> bool:
     return bool((os.getenv("K_SERVICE") or "").strip())
 
-def _local_block_response(run_id: str, stage: str) -> JSONResponse:
-    return JSONResponse(
+def _local_block_response(run_id: str, stage: str) -> AppJSONResponse:
+    return AppJSONResponse(
         {
             "ok": False,
             "status": LOCAL_BLOCKED_STATUS,
@@ -43,15 +74,36 @@ def _local_block_response(run_id: str, stage: str) -> JSONResponse:
         status_code=200,
     )
 
-def _dry_run_response(payload: dict) -> JSONResponse:
+def _bad_scope_response(run_id: str, scope: str) -> AppJSONResponse:
+    return AppJSONResponse(
+        {
+            "ok": False,
+            "status": "BAD_SCOPE",
+            "stage": "bootstrap",
+            "error": f"scope must be one of {sorted(_VALID_SCOPES)}, got {scope!r}",
+            "run_id": run_id,
+        },
+        status_code=200,
+    )
+
+def _missing_env_payload(run_id: str, scope: str, snap: date_type, missing_envs: Sequence[str]) -> dict:
+    # One dict serves as both the log record fields and the response body
+    return {
+        "ok": False,
+        "status": "ENV_MISSING",
+        "stage": "bootstrap",
+        "error": f"Missing required env var(s): {', '.join(missing_envs)}",
+        "run_id": run_id,
+        "scope": scope,
+        "snapshot_date": str(snap),
+        "missing_envs": missing_envs,
+    }
+
+def _dry_run_response(payload: dict) -> AppJSONResponse:
     payload["ok"] = True
     payload["status"] = DRY_RUN_STATUS
     payload["stage"] = "dry_run"
-    return JSONResponse(payload, status_code=200)
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Service Startup Complete")
+    return AppJSONResponse(payload, status_code=200)
 
 @app.get("/debug/import_health")
 def import_health():
@@ -59,7 +111,7 @@ def import_health():
     return {"ok": ok, "env": checks}
 
 @app.get("/cron/daily")
-def cron_daily(
+async def cron_daily(
     scope: str = Query(..., description="EU | UK | NA"),
     snapshot_date: Optional[str] = Query(None, description="YYYY-MM-DD"),
     dry: int = Query(1, description="1=dry run (no BQ write)"),
@@ -69,41 +121,47 @@ def cron_daily(
     maxPages: int = Query(50),
     pageSize: int = Query(100),
     maxOrders: int = Query(5000),
+    skipCanceledItems: int = Query(0, description="1=skip getOrderItems for canceled orders (no item rows for them)"),
 ):
     scope_u = scope.upper()
-    tz = tz_for_scope(scope_u)
     run_id = str(uuid.uuid4())
+    if scope_u not in _VALID_SCOPES:
+        return _bad_scope_response(run_id, scope)
 
-    if snapshot_date:
-        y = int(snapshot_date[0:4])
-        m = int(snapshot_date[5:7])
-        d = int(snapshot_date[8:10])
-        snap = date_type(y, m, d)
-    else:
-        snap = yesterday_local(tz)
-
-    dry_int = int(dry)
-    if dry_int != 1 and not _is_cloud_run():
+    # Blocked before any date work; the block response doesn't carry snapshot_date
+    if dry != 1 and not _is_cloud_run():
         return _local_block_response(run_id, stage="orders_list")
 
-    if dry_int == 1 and not _is_cloud_run():
+    tz = tz_for_scope(scope_u)
+    try:
+        # [:10] keeps accepting a full timestamp ("YYYY-MM-DDT...") as before
+        snap = date_type.fromisoformat(snapshot_date[:10]) if snapshot_date else yesterday_local(tz)
+    except ValueError:
+        return AppJSONResponse(
+            {
+                "ok": False,
+                "status": "INVALID_SNAPSHOT_DATE",
+                "stage": "bootstrap",
+                "error": f"snapshot_date must be YYYY-MM-DD, got {snapshot_date!r}",
+                "run_id": run_id,
+                "scope": scope_u,
+            },
+            status_code=200,
+        )
+
+    if dry == 1 and not _is_cloud_run():
         return _dry_run_response(
             {
                 "run_id": run_id,
                 "scope": scope_u,
                 "snapshot_date": str(snap),
                 "dry": True,
-                "steps": [
-                    "Fetch orders list (paginated)",
-                    "Fetch order items for each order",
-                    "Aggregate orders/items/ASIN stats",
-                    "Write results to BigQuery (skipped in dry run)",
-                ],
+                "steps": _DAILY_DRY_STEPS,
                 "params": {
                     "filter_mode": filterMode,
-                    "max_pages": int(maxPages),
-                    "page_size": int(pageSize),
-                    "max_orders": int(maxOrders),
+                    "max_pages": maxPages,
+                    "page_size": pageSize,
+                    "max_orders": maxOrders,
                 },
             }
         )
@@ -111,47 +169,30 @@ def cron_daily(
 
     missing_envs = get_missing_required_envs()
     if missing_envs:
-        logger.error(json.dumps({
-            "event": "cron_daily_env_missing",
-            "run_id": run_id,
-            "scope": scope_u,
-            "snapshot_date": str(snap),
-            "missing_envs": missing_envs,
-        }))
-        sys.stdout.flush()
-        sys.stderr.flush()
-        return JSONResponse(
-            {
-                "ok": False,
-                "status": "ENV_MISSING",
-                "stage": "bootstrap",
-                "error": f"Missing required env var(s): {', '.join(missing_envs)}",
-                "run_id": run_id,
-                "scope": scope_u,
-                "snapshot_date": str(snap),
-                "missing_envs": missing_envs,
-            },
-            status_code=200,
-        )
+        payload = _missing_env_payload(run_id, scope_u, snap, missing_envs)
+        logger.error("cron_daily_env_missing", extra={"json_fields": payload})
+        return AppJSONResponse(payload, status_code=200)
 
     try:
-        out = run_daily(
+        # SP-API/BigQuery work is blocking; run it off the event loop
+        out = await asyncio.to_thread(
+            run_daily,
             scope=scope_u,
             snapshot_date=snap,
-            dry=bool(dry_int),
-            debug_items=bool(int(debugItems)),
-            compact=bool(int(compact)),
+            dry=bool(dry),
+            debug_items=bool(debugItems),
+            compact=bool(compact),
             filter_mode=filterMode,
-            max_pages=int(maxPages),
-            page_size=int(pageSize),
-            max_orders=int(maxOrders),
+            max_pages=maxPages,
+            page_size=pageSize,
+            max_orders=maxOrders,
+            skip_canceled_items=bool(skipCanceledItems),
         )
-        return JSONResponse(out)
+        return AppJSONResponse(out)
     except SpapiRequestError as e:
         payload = e.to_dict()
         payload.update({"scope": scope_u, "snapshot_date": str(snap)})
-        logger.exception(json.dumps({
-            "event": "cron_daily_spapi_exception",
+        logger.exception("cron_daily_spapi_exception", extra={"json_fields": {
             "scope": scope_u,
             "snapshot_date": str(snap),
             "run_id": e.run_id,
@@ -159,21 +200,20 @@ def cron_daily(
             "status": e.status,
             "error": e.message,
             "debug": e.debug,
-        }))
-        sys.stdout.flush()
-        sys.stderr.flush()
-        return JSONResponse(payload, status_code=200)
+        }})
+        return AppJSONResponse(payload, status_code=200)
     except Exception as e:
-        import traceback
-        logger.exception(json.dumps({
-            "event": "cron_daily_unhandled_exception",
+        # Format the stack once; it feeds both the log record and (when requested) the response
+        trace = traceback.format_exc()
+        logger.error("cron_daily_unhandled_exception", extra={"json_fields": {
             "scope": scope_u,
             "snapshot_date": str(snap),
             "run_id": run_id,
             "exc_type": type(e).__name__,
             "exc": repr(e),
-        }))
-        include_trace = bool(int(debugItems)) or (int(compact) == 0)
+            "traceback": trace,
+        }})
+        include_trace = bool(debugItems) or not compact
         payload = {
             "ok": False,
             "response_stage": "unhandled_exception",
@@ -182,16 +222,14 @@ def cron_daily(
             "error": {"type": type(e).__name__, "message": str(e)},
         }
         if include_trace:
-            payload["trace"] = traceback.format_exc()
-        sys.stdout.flush()
-        sys.stderr.flush()
-        return JSONResponse(
+            payload["trace"] = trace
+        return AppJSONResponse(
             payload,
             status_code=200,
         )
 
 @app.get("/cron/inventory")
-def cron_inventory(
+async def cron_inventory(
     scope: str = Query(..., description="EU | UK | NA"),
     dry: int = Query(1, description="1=dry run")
 ):
@@ -199,41 +237,38 @@ def cron_inventory(
     Fetches current inventory (FBA + AWD) for the given scope.
     Snapshot date is UTC Today.
     """
-    run_id = str(uuid.uuid4())
-    dry_int = int(dry)
+    scope_u = scope.upper()
+    if scope_u not in _VALID_SCOPES:
+        return _bad_scope_response(str(uuid.uuid4()), scope)
 
-    if dry_int != 1 and not _is_cloud_run():
-        return _local_block_response(run_id, stage="fba_summary")
+    # Only the short-circuit responses need a run_id here; run_inventory mints its own
+    if dry != 1 and not _is_cloud_run():
+        return _local_block_response(str(uuid.uuid4()), stage="fba_summary")
 
-    if dry_int == 1:
+    if dry == 1:
         return _dry_run_response(
             {
-                "run_id": run_id,
-                "scope": scope.upper(),
+                "run_id": str(uuid.uuid4()),
+                "scope": scope_u,
                 "dry": True,
-                "steps": [
-                    "Fetch FBA inventory summaries",
-                    "Fetch AWD inventory (NA only)",
-                    "Write inventory snapshots to BigQuery (skipped in dry run)",
-                ],
+                "steps": _INVENTORY_DRY_STEPS,
             }
         )
 
     try:
-        out = run_inventory(scope=scope.upper(), dry=bool(dry_int))
-        return JSONResponse(out)
+        out = await asyncio.to_thread(run_inventory, scope=scope_u, dry=bool(dry))
+        return AppJSONResponse(out)
     except SpapiRequestError as e:
         payload = e.to_dict()
-        payload.update({"scope": scope.upper()})
-        return JSONResponse(payload, status_code=200)
+        payload.update({"scope": scope_u})
+        return AppJSONResponse(payload, status_code=200)
     except Exception as e:
-        import traceback
-        return JSONResponse(
+        return AppJSONResponse(
             {
                 "ok": False,
                 "status": 0,
                 "stage": "error",
-                "scope": scope,
+                "scope": scope_u,
                 "error": str(e),
                 "run_id": "unknown",
                 "trace": traceback.format_exc()
@@ -242,7 +277,7 @@ def cron_inventory(
         )
 
 @app.get("/debug/spapi_orders_probe")
-def debug_spapi_orders_probe(
+async def debug_spapi_orders_probe(
     scope: str = Query(..., description="EU | NA"),
     createdAfter: Optional[str] = Query(None, description="ISO Date string override e.g. 2024-05-01T00:00:00Z"),
     maxPages: int = 1,
@@ -261,7 +296,8 @@ def debug_spapi_orders_probe(
     dummy_date = date_type.today()
     
     try:
-        orders, debug_info = fetch_orders_for_scope(
+        orders, debug_info = await asyncio.to_thread(
+            fetch_orders_for_scope,
             scope=scope_u,
             snapshot_date=dummy_date,
             max_pages=maxPages,
@@ -271,20 +307,18 @@ def debug_spapi_orders_probe(
         )
         
         # Serialize a few orders to see raw data
-        sample_orders = []
-        for o in orders[:5]:
-            sample_orders.append({
-                "AmazonOrderId": o.amazon_order_id,
-                "Status": o.order_status,
-                "Raw": o.raw
-            })
-            
-        return {
+        sample_orders = [
+            {"AmazonOrderId": o["AmazonOrderId"], "Status": str(o.get("OrderStatus") or ""), "Raw": o}
+            for o in orders[:5]
+        ]
+
+        # Returned as a response directly so FastAPI skips jsonable_encoder over the raw payloads
+        return AppJSONResponse({
             "ok": True,
             "run_id": run_id,
             "orders_found": len(orders),
             "debug_info": debug_info,
             "first_5_samples": sample_orders
-        }
+        })
     except Exception as e:
         return {"ok": False, "error": str(e)}
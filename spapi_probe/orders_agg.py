@@ -1,85 +1,104 @@
 from __future__ import annotations
 
-import json
+import sys
 import time
 import uuid
 import logging
-from dataclasses import dataclass
+import threading
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, datetime
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from google.cloud import bigquery
 
 from .config import (
+    BQ_LOAD_JOB_THRESHOLD,
     bq_orders_raw_table_id,
     bq_orders_agg_table_id,
     bq_order_items_raw_table_id,
     bq_sales_asin_daily_table_id,
     marketplace_ids_for_scope,
     marketplaces_for_scope,
-    country_for_marketplace_id,
     tz_for_scope,
 )
-from .spapi_core import spapi_request_json, SpapiRequestError
+from .bq import bq_client, insert_rows_chunked, load_rows_json
+from .spapi_core import retry_spapi, spapi_request_json, SpapiRequestError
+from .utils_json import dumps_bytes, dumps_str
+from .utils_rate import RatePacer, pacer_for, rate_limit_from_debug
 from .utils_time import day_window_utc
 
 # Configure structured logging
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 logger = logging.getLogger("spapi_orders")
 
-@dataclass
-class OrderLite:
-    amazon_order_id: str
-    marketplace_id: str
-    order_status: str
-    sales_channel: str
-    raw: Dict[str, Any]
-
-def _retry_spapi(fn, *, stage: str, run_id: str, max_tries: int = 6, base_sleep: float = 0.8):
-    """Retry SP-API calls on 429/503/504 with exponential backoff."""
-    last_exc: Optional[Exception] = None
-    for i in range(max_tries):
-        try:
-            resp = fn()
-            if isinstance(resp, dict) and not resp.get("ok", False):
-                status = int(resp.get("status") or 0)
-                err = SpapiRequestError(
-                    message=resp.get("error") or "SP-API request failed",
-                    status=status,
-                    stage=stage,
-                    run_id=run_id,
-                    debug=resp.get("debug") or {},
-                )
-                if status in (429, 503, 504):
-                    last_exc = err
-                    time.sleep(base_sleep * (2 ** i))
-                    continue
-                raise err
-            return resp
-        except SpapiRequestError as e:
-            last_exc = e
-            if e.status in (429, 503, 504) and i < max_tries - 1:
-                time.sleep(base_sleep * (2 ** i))
-                continue
-            raise
-        except Exception as e:
-            last_exc = e
-            raise
-    if last_exc:
-        raise last_exc
-    raise RuntimeError("SP-API retry exhausted")
+# Documented getOrders default rate (requests/sec) and burst; the rate follows x-amzn-RateLimit-Limit
+ORDERS_PATH = "/orders/v0/orders"
+ORDERS_RATE = 0.0167
+ORDERS_BURST = 20.0
+# Concurrent getOrderItems calls in process_orders_and_items
+ORDER_ITEMS_CONCURRENCY = 8
+# Documented getOrderItems default rate (requests/sec) and burst; the rate follows x-amzn-RateLimit-Limit
+ORDER_ITEMS_PATH = "/orders/v0/orders/{orderId}/orderItems"
+ORDER_ITEMS_RATE = 0.5
+ORDER_ITEMS_BURST = 30.0
+# Raw order/item rows are written every this many rows instead of being held until the end of the run
+RAW_ROWS_FLUSH_EVERY = 1000
+
+RowSink = Callable[[Dict[str, Any]], None]
+
+# (fetched_at, response) per debug probe, keyed by (api scope, query); reruns of the same window within the TTL reuse them
+_PROBE_TTL_SEC = 30.0
+_PROBE_CACHE_MAX = 64
+_PROBE_CACHE: Dict[Tuple[str, Tuple[Tuple[str, Any], ...]], Tuple[float, Dict[str, Any]]] = {}
+_PROBE_LOCK = threading.Lock()
+
+# Lowercased OrderStatus values counted as canceled (SP-API spells it "Canceled"; accept the UK spelling too)
+_CANCELED_STATUSES = frozenset(("canceled", "cancelled"))
+# Lowercased SalesChannel prefix of Amazon storefronts ("Amazon.de", "Amazon.co.uk", ...)
+_AMAZON_CHANNEL_PREFIX = "amazon"
+
+def _retry_spapi(fn, *, stage: str, run_id: str):
+    """Retry SP-API calls on 429/503/504 via retry_spapi (full-jitter backoff, Retry-After honoured when sent)."""
+    return retry_spapi(fn, stage=stage, run_id=run_id, max_tries=6, base_sleep=0.8)
 
 def _truncate_text(value: Any, max_len: int) -> str:
     if value is None:
         return ""
     if isinstance(value, (dict, list)):
-        text = json.dumps(value, ensure_ascii=True)
-    else:
-        text = str(value)
+        # Cut the encoded bytes before decoding (max_len counts UTF-8 bytes here); a split character is dropped
+        return dumps_bytes(value)[:max_len].decode("utf-8", "ignore")
+    text = value if isinstance(value, str) else str(value)
     if len(text) > max_len:
         return text[:max_len]
     return text
 
+def _probe_orders_cached(api_scope: str, pacer: RatePacer, query: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    getOrders for a debug probe; successful responses are reused for _PROBE_TTL_SEC. Misses spend a getOrders token.
+    Returns (response, age in seconds of the cached response, or None if this call hit SP-API).
+    """
+    key = (api_scope, tuple(sorted(query.items())))
+    now = time.monotonic()
+    with _PROBE_LOCK:
+        hit = _PROBE_CACHE.get(key)
+        if hit and now - hit[0] < _PROBE_TTL_SEC:
+            return hit[1], now - hit[0]
+    pacer.wait()
+    resp = spapi_request_json(scope=api_scope, method="GET", path=ORDERS_PATH, query=query)
+    pacer.update_rate(rate_limit_from_debug(resp.get("debug")))
+    if resp.get("ok"):
+        with _PROBE_LOCK:
+            if len(_PROBE_CACHE) >= _PROBE_CACHE_MAX:
+                _PROBE_CACHE.clear()
+            _PROBE_CACHE[key] = (time.monotonic(), resp)
+    return resp, None
+
+def _spapi_scope(scope: str) -> str:
+    """SP-API routing scope: UK is served by the EU endpoint and refresh token."""
+    s = scope.upper()
+    return "EU" if s in ("EU", "UK") else s
+
 def _unwrap_spapi_payload(x: Any) -> Any:
     """SP-API bodies are often wrapped like {"payload": {...}} (sometimes multiple times).
     Unwrap repeatedly until the inner body is reached.
@@ -89,18 +108,28 @@ def _unwrap_spapi_payload(x: Any) -> Any:
         cur = cur.get("payload") or {}
     return cur
 
+def _summarize_payload(inner: Any) -> Tuple[int, Optional[str], List[str]]:
+    """(orders_in_batch, NextToken, sorted keys) of an unwrapped getOrders body; (0, None, []) if it isn't a dict."""
+    if not isinstance(inner, dict):
+        return 0, None, []
+    return len(inner.get("Orders") or []), inner.get("NextToken"), sorted(inner.keys())
+
 def _extract_item_units(item: Dict[str, Any]) -> int:
     q = item.get("QuantityOrdered") or 0
     qc = item.get("QuantityCancelled") or 0
-    try:
-        q = int(q)
-    except Exception:
-        q = 0
-    try:
-        qc = int(qc)
-    except Exception:
-        qc = 0
-    return max(0, q - qc)
+    # SP-API sends ints; only coerce anything else
+    if type(q) is not int:
+        try:
+            q = int(q)
+        except Exception:
+            q = 0
+    if type(qc) is not int:
+        try:
+            qc = int(qc)
+        except Exception:
+            qc = 0
+    d = q - qc
+    return d if d > 0 else 0
 
 def fetch_orders_for_scope(
     scope: str,
@@ -115,7 +144,8 @@ def fetch_orders_for_scope(
     custom_created_before: Optional[str] = None,
     include_debug: bool = False,
     compact: bool = True,
-) -> Tuple[List[OrderLite], Dict[str, Any]]:
+) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Returns (orders, debug); orders are the getOrders dicts as returned, minus entries lacking an id or marketplace."""
     tz = tz_for_scope(scope)
     dt_start_utc, dt_end_utc = day_window_utc(tz, snapshot_date)
     
@@ -126,31 +156,33 @@ def fetch_orders_for_scope(
         dt_end_utc = custom_created_before
 
     marketplace_ids = marketplace_ids_for_scope(scope)
+    api_scope = _spapi_scope(scope)
+    # Shared by the page loop and the debug probes; waits only once the getOrders burst is spent
+    pacer = pacer_for(api_scope, ORDERS_PATH, ORDERS_RATE, ORDERS_BURST)
 
-    orders: List[OrderLite] = []
+    orders: List[Dict[str, Any]] = []
     pages = 0
     pages_fetched_total = 0
     next_token: Optional[str] = None
     orders_raw_total = 0
     orders_canceled_total = 0
 
-    # Build query params
+    # Build query params; the window part and the joined ids are fixed for the whole run
+    # Using CreatedAfter/Before by default; caller can switch to LastUpdated
+    if filter_mode.lower().startswith("last"):
+        window_params = {"LastUpdatedAfter": dt_start_utc, "LastUpdatedBefore": dt_end_utc}
+    else:
+        window_params = {"CreatedAfter": dt_start_utc, "CreatedBefore": dt_end_utc}
+    marketplace_ids_csv = ",".join(marketplace_ids)
+
     def build_params(marketplace_ids_value: str, *, include_next_token: bool) -> Dict[str, Any]:
-        p: Dict[str, Any] = {"MarketplaceIds": marketplace_ids_value, "PageSize": page_size}
+        # A fresh dict per call: the debug entries keep the query they were sent with
         if include_next_token and next_token:
-            p["NextToken"] = next_token
-        else:
-            # Using CreatedAfter/Before by default; caller can switch to LastUpdated
-            if filter_mode.lower().startswith("last"):
-                p["LastUpdatedAfter"] = dt_start_utc
-                p["LastUpdatedBefore"] = dt_end_utc
-            else:
-                p["CreatedAfter"] = dt_start_utc
-                p["CreatedBefore"] = dt_end_utc
+            return {"MarketplaceIds": marketplace_ids_value, "PageSize": page_size, "NextToken": next_token}
         # Explicitly ask for statuses if needed, but default returns most useful ones except Pending sometimes
         # To be safe for "sales", we usually want everything that isn't Canceled, but raw orders should keep Canceled.
         # We fetch all by default (API default).
-        return p
+        return {"MarketplaceIds": marketplace_ids_value, "PageSize": page_size, **window_params}
 
     debug = {
         "run_id": run_id,
@@ -160,40 +192,45 @@ def fetch_orders_for_scope(
     }
     mp_map = marketplaces_for_scope(scope)
 
-    logger.info(json.dumps({"event": "fetch_orders_start", "scope": scope, "params": debug}))
+    logger.info(dumps_str({"event": "fetch_orders_start", "scope": scope, "params": debug}))
 
     while True:
         if pages >= max_pages or len(orders) >= max_orders:
             break
 
-        logger.info(json.dumps({
-            "event": "orders_list_call_begin",
-            "run_id": run_id,
-            "stage": "orders_list",
-            "scope": scope,
-            "marketplace_ids": marketplace_ids,
-            "filter_mode": filter_mode,
-            "dt_start_utc": dt_start_utc,
-            "dt_end_utc": dt_end_utc,
-            "page_size": page_size,
-            "max_pages": max_pages,
-            "max_orders": max_orders,
-            "has_next_token": bool(next_token),
-        }))
-        params = build_params(",".join(marketplace_ids), include_next_token=True)
+        # The per-page logs are skipped entirely (no dict, no encode) when INFO is filtered out
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(dumps_str({
+                "event": "orders_list_call_begin",
+                "run_id": run_id,
+                "stage": "orders_list",
+                "scope": scope,
+                "marketplace_ids": marketplace_ids,
+                "filter_mode": filter_mode,
+                "dt_start_utc": dt_start_utc,
+                "dt_end_utc": dt_end_utc,
+                "page_size": page_size,
+                "max_pages": max_pages,
+                "max_orders": max_orders,
+                "has_next_token": bool(next_token),
+            }))
+        params = build_params(marketplace_ids_csv, include_next_token=True)
 
         def _call():
-            return spapi_request_json(
-                scope="EU" if scope.upper() in ("EU", "UK") else scope.upper(),
+            pacer.wait()
+            resp = spapi_request_json(
+                scope=api_scope,
                 method="GET",
-                path="/orders/v0/orders",
+                path=ORDERS_PATH,
                 query=params,
             )
+            pacer.update_rate(rate_limit_from_debug(resp.get("debug")))
+            return resp
 
         try:
             resp = _retry_spapi(_call, stage="orders_list", run_id=run_id)
         except SpapiRequestError as e:
-            logger.exception(json.dumps({
+            logger.exception(dumps_str({
                 "event": "orders_list_failed",
                 "run_id": run_id,
                 "scope": scope,
@@ -201,14 +238,14 @@ def fetch_orders_for_scope(
                 "filter_mode": filter_mode,
                 "dt_start_utc": dt_start_utc,
                 "dt_end_utc": dt_end_utc,
-                "marketplace_ids": ",".join(marketplace_ids),
+                "marketplace_ids": marketplace_ids_csv,
                 "status": e.status,
                 "message": e.message,
                 "debug": e.debug,
             }))
             raise
         except Exception as e:
-            logger.exception(json.dumps({
+            logger.exception(dumps_str({
                 "event": "orders_list_failed",
                 "run_id": run_id,
                 "scope": scope,
@@ -216,11 +253,13 @@ def fetch_orders_for_scope(
                 "filter_mode": filter_mode,
                 "dt_start_utc": dt_start_utc,
                 "dt_end_utc": dt_end_utc,
-                "marketplace_ids": ",".join(marketplace_ids),
+                "marketplace_ids": marketplace_ids_csv,
                 "error": str(e),
             }))
             raise
         pages_fetched_total += 1
+        # Unwrapped once; the debug summary and the page loop below both read it
+        payload = _unwrap_spapi_payload(resp.get("payload") or {})
         if include_debug:
             resp_debug = resp.get("debug") or {}
             request_id = resp_debug.get("request_id") or resp_debug.get("rid")
@@ -233,12 +272,8 @@ def fetch_orders_for_scope(
                 query_text,
             )
             body_value = resp.get("payload")
-            payload_inner = _unwrap_spapi_payload(body_value)
             body_text = _truncate_text(body_value, 2000) if compact else _truncate_text(body_value, 200000)
-            orders_in_batch = len(payload_inner.get("Orders") or []) if isinstance(payload_inner, dict) else 0
-            next_token_value = None
-            if isinstance(payload_inner, dict):
-                next_token_value = payload_inner.get("NextToken")
+            orders_in_batch, next_token_value, payload_keys = _summarize_payload(payload)
             list_orders_debug = {
                 "status_code": resp.get("status"),
                 "request_id": request_id,
@@ -256,24 +291,14 @@ def fetch_orders_for_scope(
                 "orders_in_batch": orders_in_batch,
                 "has_next_token": bool(next_token_value),
                 "next_token": _truncate_text(next_token_value, 60),
-                "payload_keys": sorted(payload_inner.keys()) if isinstance(payload_inner, dict) else [],
+                "payload_keys": payload_keys,
             }
             debug["list_orders"] = list_orders_debug
             debug.setdefault("list_orders_by_country", {})
             if pages == 0:
-                for cc, mid in mp_map.items():
+                def _country_debug(cc: str, mid: str) -> Dict[str, Any]:
                     country_params = build_params(mid, include_next_token=False)
-
-                    def _call_country():
-                        return spapi_request_json(
-                            scope="EU" if scope.upper() in ("EU", "UK") else scope.upper(),
-                            method="GET",
-                            path="/orders/v0/orders",
-                            query=country_params,
-                        )
-
-                    country_resp = _call_country()
-                    pages_fetched_total += 1
+                    country_resp, cached_age = _probe_orders_cached(api_scope, pacer, country_params)
                     country_debug = country_resp.get("debug") or {}
                     country_request_id = country_debug.get("request_id") or country_debug.get("rid")
                     country_body_value = country_resp.get("payload")
@@ -283,23 +308,21 @@ def fetch_orders_for_scope(
                         if compact
                         else _truncate_text(country_body_value, 200000)
                     )
-                    country_orders_in_batch = (
-                        len(country_payload_inner.get("Orders") or [])
-                        if isinstance(country_payload_inner, dict)
-                        else 0
+                    country_orders_in_batch, country_next_token_value, country_payload_keys = _summarize_payload(
+                        country_payload_inner
                     )
-                    country_next_token_value = None
-                    if isinstance(country_payload_inner, dict):
-                        country_next_token_value = country_payload_inner.get("NextToken")
                     logger.info(
-                        "event=list_orders_debug;run_id=%s;status_code=%s;request_id=%s;query=%s",
+                        "event=list_orders_debug;run_id=%s;status_code=%s;request_id=%s;cached=%s;query=%s",
                         run_id,
                         country_resp.get("status"),
                         country_request_id,
+                        cached_age is not None,
                         _truncate_text(country_params, 1000),
                     )
-                    debug["list_orders_by_country"][cc] = {
+                    entry = {
                         "status_code": country_resp.get("status"),
+                        # On a cache hit request_id/rid belong to the earlier call that produced the response
+                        "cached": cached_age is not None,
                         "request_id": country_request_id,
                         "rid": country_debug.get("rid"),
                         "path": "/orders/v0/orders",
@@ -315,105 +338,161 @@ def fetch_orders_for_scope(
                         "orders_in_batch": country_orders_in_batch,
                         "has_next_token": bool(country_next_token_value),
                         "next_token": _truncate_text(country_next_token_value, 60),
-                        "payload_keys": (
-                            sorted(country_payload_inner.keys())
-                            if isinstance(country_payload_inner, dict)
-                            else []
-                        ),
+                        "payload_keys": country_payload_keys,
                         "country": cc,
                         "marketplace_id": mid,
                     }
-        payload = _unwrap_spapi_payload(resp.get("payload") or {})
+                    if cached_age is not None:
+                        entry["cached_age_sec"] = round(cached_age, 1)
+                    return entry
+
+                # The per-country probes are independent; issue them together rather than one RTT after another
+                with ThreadPoolExecutor(max_workers=max(1, len(mp_map))) as ex:
+                    country_debugs = list(ex.map(_country_debug, mp_map.keys(), mp_map.values()))
+                # Only probes that reached SP-API count as fetched pages
+                pages_fetched_total += sum(1 for e in country_debugs if not e["cached"])
+                for country_entry in country_debugs:
+                    debug["list_orders_by_country"][country_entry["country"]] = country_entry
         fetched_batch = payload.get("Orders") or []
         orders_raw_total += len(fetched_batch)
+        orders_canceled_total += sum(
+            1 for o in fetched_batch if (o.get("OrderStatus") or "").lower() in _CANCELED_STATUSES
+        )
+
         for o in fetched_batch:
-            status = (o.get("OrderStatus") or "").lower()
-            if status in ("canceled", "cancelled"):
-                orders_canceled_total += 1
-        
-        for o in fetched_batch:
-            aoid = o.get("AmazonOrderId")
-            mid = o.get("MarketplaceId")
-            if not aoid or not mid:
+            if not o.get("AmazonOrderId") or not o.get("MarketplaceId"):
                 continue
-            orders.append(
-                OrderLite(
-                    amazon_order_id=aoid,
-                    marketplace_id=mid,
-                    order_status=str(o.get("OrderStatus") or ""),
-                    sales_channel=str(o.get("SalesChannel") or ""),
-                    raw=o,
-                )
-            )
+            orders.append(o)
             if len(orders) >= max_orders:
                 break
 
         pages += 1
         next_token = payload.get("NextToken")
         
-        logger.info(json.dumps({
-            "event": "fetch_page",
-            "run_id": run_id,
-            "page": pages, 
-            "orders_in_batch": len(fetched_batch),
-            "total_orders": len(orders),
-            "has_next_token": bool(next_token)
-        }))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(dumps_str({
+                "event": "fetch_page",
+                "run_id": run_id,
+                "page": pages, 
+                "orders_in_batch": len(fetched_batch),
+                "total_orders": len(orders),
+                "has_next_token": bool(next_token)
+            }))
 
         if not next_token:
             break
 
-        # Gentle pacing to avoid throttles when looping
-        time.sleep(0.15)
-
     debug["pages_fetched"] = pages_fetched_total
     debug["orders_fetched"] = len(orders)
     debug["orders_raw_total"] = orders_raw_total
     debug["orders_canceled_total"] = orders_canceled_total
     return orders, debug
 
+def _fetch_order_items(api_scope: str, pacer: RatePacer, amazon_order_id: str, run_id: str) -> Dict[str, Any]:
+    path = f"/orders/v0/orders/{amazon_order_id}/orderItems"
+
+    # No query string; spapi_request_json treats a missing query as empty
+    def _call_items():
+        pacer.wait()
+        resp = spapi_request_json(scope=api_scope, method="GET", path=path)
+        pacer.update_rate(rate_limit_from_debug(resp.get("debug")))
+        return resp
+    return _retry_spapi(_call_items, stage="order_items", run_id=run_id)
+
+def _iter_order_items(
+    scope: str, orders: List[Dict[str, Any]], run_id: str, skip_canceled: bool = False
+) -> Iterator[Any]:
+    """
+    Fetch orderItems for every order, ORDER_ITEMS_CONCURRENCY at a time.
+    Yields one entry per order, in order, as soon as it is ready: the response dict or the exception it raised,
+    so the caller aggregates early orders while later ones are still in flight.
+    With skip_canceled, canceled orders are not fetched and yield None.
+    Queued calls are dropped after the first failed fetch or when the generator is closed; callers close it
+    in a finally so a raise of their own drops them too.
+    """
+    api_scope = _spapi_scope(scope)
+    # Waits only once the burst is spent, instead of a fixed sleep per order
+    pacer = pacer_for(api_scope, ORDER_ITEMS_PATH, ORDER_ITEMS_RATE, ORDER_ITEMS_BURST)
+    ex = ThreadPoolExecutor(max_workers=ORDER_ITEMS_CONCURRENCY)
+    try:
+        futures = [
+            None
+            if skip_canceled and str(o.get("OrderStatus") or "").lower() in _CANCELED_STATUSES
+            else ex.submit(_fetch_order_items, api_scope, pacer, o["AmazonOrderId"], run_id)
+            for o in orders
+        ]
+        for fut in futures:
+            if fut is None:
+                yield None
+                continue
+            try:
+                res = fut.result()
+            except Exception as e:
+                # The caller stops at this order, so drop the calls still queued behind it
+                ex.shutdown(wait=False, cancel_futures=True)
+                res = e
+            yield res
+    finally:
+        # Runs on exhaustion or when the generator is closed early; never blocks on in-flight calls
+        ex.shutdown(wait=False, cancel_futures=True)
+
 def process_orders_and_items(
     scope: str,
-    orders: List[OrderLite],
+    orders: List[Dict[str, Any]],
     *,
     debug_items: bool = False,
     run_id: str = "debug",
     window_info: Optional[Dict[str, Any]] = None,
-) -> Tuple[Dict[str, Any], List[Dict[str, Any]], List[Dict[str, Any]], List[Dict[str, Any]]]:
+    orders_sink: RowSink,
+    items_sink: RowSink,
+    skip_canceled_items: bool = False,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
     """
+    Passes each probe_orders_raw row to orders_sink and each probe_order_items_raw row to items_sink
+    as it is built (minus scope/snapshot_date/ingested_at/run_id).
+    skip_canceled_items: don't call getOrderItems for canceled orders. They still count in canceled_orders
+    and get their raw order row, but write no item rows and no per-ASIN canceled_orders.
     Returns:
       totals: summary stats
-      raw_orders_rows: BQ rows for probe_orders_raw
-      raw_items_rows: BQ rows for probe_order_items_raw
       asin_daily_rows: BQ rows for probe_sales_asin_daily
     """
     mp_map = marketplaces_for_scope(scope)
+    # Same result as country_for_marketplace_id, without the per-order scope check
+    mid_to_cc = {mid: cc for cc, mid in mp_map.items()}
 
+    # cc -> {marketplace_id, orders_count, units_sold}; bound once, the order loop updates it per order
+    breakdown: Dict[str, Dict[str, Any]] = {}
     totals = {
         "orders_count": 0,
         "units_sold": 0,
         "canceled_orders": 0,
         "excluded_non_amazon_orders": 0,
-        "breakdown": {},  # cc -> {marketplace_id, orders_count, units_sold}
+        "breakdown": breakdown,
     }
 
     # Prepare per-country aggregators
     for cc, mid in mp_map.items():
-        totals["breakdown"][cc] = {"marketplace_id": mid, "orders_count": 0, "units_sold": 0}
+        breakdown[cc] = {"marketplace_id": mid, "orders_count": 0, "units_sold": 0}
+
 
-    raw_orders_rows: List[Dict[str, Any]] = []
-    raw_items_rows: List[Dict[str, Any]] = []
-    
     # Aggregation buffer for ASIN daily: 
     # Key: (country, marketplace_id, asin)
-    # Value: {orders_count, units_sold, canceled_orders}
-    asin_agg: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+    # Value: [orders_count, units_sold, canceled_orders]
+    asin_agg: Dict[Tuple[str, str, str], List[int]] = defaultdict(lambda: [0, 0, 0])
     seen_non_canceled: set[Tuple[str, str]] = set()
     seen_canceled: set[Tuple[str, str]] = set()
+    # debug_items sample comes from the first order actually fetched (skip_canceled_items may skip order 0)
+    sample_taken = False
     order_items_by_country: Dict[str, Dict[str, Any]] = {}
     window_payload = window_info or {}
-    for cc, mid in mp_map.items():
-        order_items_by_country[cc] = {
+    # The same for every country; entries share this one dict (it is only ever serialized)
+    items_window = {
+        "dt_start_utc": window_payload.get("dt_start_utc"),
+        "dt_end_utc": window_payload.get("dt_end_utc_raw"),
+    }
+
+    def _new_items_debug(mid: str) -> Dict[str, Any]:
+        return {
             "orders_in_batch": 0,
             "items_fetched": 0,
             "items_after_filter": 0,
@@ -421,230 +500,218 @@ def process_orders_and_items(
             "http_status": None,
             "spapi_status": None,
             "marketplace_id": mid,
-            "window": {
-                "dt_start_utc": window_payload.get("dt_start_utc"),
-                "dt_end_utc": window_payload.get("dt_end_utc_raw"),
-            },
+            "window": items_window,
         }
 
-    for i, o in enumerate(orders):
-        cc = country_for_marketplace_id(scope, o.marketplace_id)
-        status = (o.order_status or "").lower()
-
-        is_canceled = status == "canceled" or status == "cancelled"
-        order_key = (o.amazon_order_id, o.marketplace_id)
-        if is_canceled:
-            if order_key not in seen_canceled:
-                totals["canceled_orders"] += 1
-                seen_canceled.add(order_key)
-
-        items_debug = order_items_by_country.setdefault(
-            cc,
-            {
-                "orders_in_batch": 0,
-                "items_fetched": 0,
-                "items_after_filter": 0,
-                "first_error": None,
-                "http_status": None,
-                "spapi_status": None,
-                "marketplace_id": o.marketplace_id,
-                "window": {
-                    "dt_start_utc": window_payload.get("dt_start_utc"),
-                    "dt_end_utc": window_payload.get("dt_end_utc_raw"),
-                },
-            },
-        )
-        items_debug["orders_in_batch"] += 1
-
-        sales_channel = (o.sales_channel or "").strip()
-        sc_l = sales_channel.lower()
-        # SP-API commonly returns values like "Amazon.de" / "Amazon.es".
-        # Treat any SalesChannel that starts with "amazon" as Amazon; everything else is Non-Amazon.
-        is_non_amazon = bool(sc_l) and (not sc_l.startswith("amazon"))
-        if is_non_amazon:
-            totals["excluded_non_amazon_orders"] += 1
-
-        # We assume we want to track ASIN stats even if canceled (recorded as canceled_orders)
-        # But we exclude non-amazon from "units_sold" totals usually? 
-        # For simplicity, we process items for ALL fetched orders to have complete raw data.
-        
-        # Determine if this order contributes to "Valid Sales"
-        is_valid_sale = (not is_canceled) and (not is_non_amazon)
+    for cc, mid in mp_map.items():
+        order_items_by_country[cc] = _new_items_debug(mid)
+
+    # Item fetches run concurrently ahead of this loop, which aggregates them in order
+    items_results = _iter_order_items(scope, orders, run_id, skip_canceled_items)
+    total_orders = len(orders)
 
-        units_in_order = 0
-        per_order_asin_units: Dict[str, int] = {}
+    try:
+        for i, (o, items_resp) in enumerate(zip(orders, items_results)):
+            amazon_order_id = o["AmazonOrderId"]
+            # Low-cardinality columns repeated on every raw row: intern them so buffered rows share one string
+            marketplace_id = sys.intern(str(o["MarketplaceId"]))
+            order_status = sys.intern(str(o.get("OrderStatus") or ""))
+            cc = mid_to_cc.get(marketplace_id, "UNK")
+            is_canceled = order_status.lower() in _CANCELED_STATUSES
+            order_key = (amazon_order_id, marketplace_id)
+            if is_canceled:
+                if order_key not in seen_canceled:
+                    totals["canceled_orders"] += 1
+                    seen_canceled.add(order_key)
+
+            items_debug = order_items_by_country.get(cc)
+            if items_debug is None:
+                items_debug = order_items_by_country[cc] = _new_items_debug(marketplace_id)
+            items_debug["orders_in_batch"] += 1
+
+            sc_l = str(o.get("SalesChannel") or "").strip().lower()
+            # SP-API commonly returns values like "Amazon.de" / "Amazon.es".
+            # Treat any SalesChannel that starts with "amazon" as Amazon; everything else is Non-Amazon.
+            is_non_amazon = bool(sc_l) and (not sc_l.startswith(_AMAZON_CHANNEL_PREFIX))
+            if is_non_amazon:
+                totals["excluded_non_amazon_orders"] += 1
+
+            # We assume we want to track ASIN stats even if canceled (recorded as canceled_orders)
+            # But we exclude non-amazon from "units_sold" totals usually? 
+            # Items are processed for ALL fetched orders to have complete raw data, unless skip_canceled_items
+            # left canceled orders out (see the docstring).
         
-        # Fetch items
-        def _call_items():
-            return spapi_request_json(
-                scope="EU" if scope.upper() in ("EU", "UK") else scope.upper(),
-                method="GET",
-                path=f"/orders/v0/orders/{o.amazon_order_id}/orderItems",
-                query={},
-            )
+            # Determine if this order contributes to "Valid Sales"
+            is_valid_sale = (not is_canceled) and (not is_non_amazon)
+
+            units_in_order = 0
+            per_order_asin_units: Dict[str, int] = defaultdict(int)
         
-        try:
-            items_resp = _retry_spapi(_call_items, stage="order_items", run_id=run_id)
-            payload = _unwrap_spapi_payload(items_resp.get("payload") or {})
-            items_list = payload.get("OrderItems") or []
-            items_debug["http_status"] = items_resp.get("status")
-            items_debug["spapi_status"] = items_resp.get("status")
-            if not isinstance(payload, dict) or "OrderItems" not in payload:
-                msg = "OrderItems missing in response payload"
+            try:
+                if isinstance(items_resp, Exception):
+                    raise items_resp
+                if items_resp is None:
+                    # Canceled order skipped via skip_canceled_items
+                    items_list = []
+                else:
+                    payload = _unwrap_spapi_payload(items_resp.get("payload") or {})
+                    items_list = payload.get("OrderItems") or []
+                    items_debug["http_status"] = items_resp.get("status")
+                    items_debug["spapi_status"] = items_resp.get("status")
+                    if not isinstance(payload, dict) or "OrderItems" not in payload:
+                        msg = "OrderItems missing in response payload"
+                        if not items_debug["first_error"]:
+                            items_debug["first_error"] = msg
+                        raise SpapiRequestError(
+                            message=msg,
+                            status=int(items_resp.get("status") or 0),
+                            stage="fetch_order_items",
+                            run_id=run_id,
+                            debug={
+                                "order_id": amazon_order_id,
+                                "marketplace_id": marketplace_id,
+                                "country": cc,
+                                "payload_keys": sorted(payload.keys()) if isinstance(payload, dict) else [],
+                                "order_items_by_country": order_items_by_country,
+                            },
+                        )
+                    if isinstance(items_list, list):
+                        items_debug["items_fetched"] += len(items_list)
+                    if debug_items and not sample_taken:
+                        sample_taken = True
+                        try:
+                            totals["_debug_order_items_sample"] = {
+                                "status": items_resp.get("status"),
+                                "ok": items_resp.get("ok"),
+                                "payload_type": type(payload).__name__,
+                                "payload_keys": sorted(payload.keys()) if isinstance(payload, dict) else [],
+                                "items_len": len(items_list) if isinstance(items_list, list) else 0,
+                            }
+                        except Exception:
+                            totals["_debug_order_items_sample"] = {"error": "failed_to_capture"}
+
+                for it in items_list:
+                    asin = it.get("ASIN")
+                    seller_sku = it.get("SellerSKU")
+                    qty_purchased = it.get("QuantityOrdered") or 0
+                
+                    # Check cancellation at item level? Usually we use order status, 
+                    # but item level also has QuantityCancelled.
+                    units = _extract_item_units(it)
+
+                    # Add to Item Raw Rows
+                    items_sink({
+                        "amazon_order_id": amazon_order_id,
+                        "asin": asin,
+                        "seller_sku": seller_sku,
+                        "quantity_ordered": int(qty_purchased),
+                        "item_status": order_status, # Inherit order status
+                        "raw_json_str": dumps_str(it),
+                        "country": cc,
+                        "marketplace_id": marketplace_id,
+                    })
+
+                    if is_valid_sale and units > 0:
+                        units_in_order += units
+                    if asin:
+                        per_order_asin_units[asin] += units
+                items_debug["items_after_filter"] += units_in_order
+
+            except SpapiRequestError as e:
                 if not items_debug["first_error"]:
-                    items_debug["first_error"] = msg
+                    items_debug["first_error"] = e.message
                 raise SpapiRequestError(
-                    message=msg,
-                    status=int(items_resp.get("status") or 0),
+                    message=e.message,
+                    status=e.status,
                     stage="fetch_order_items",
                     run_id=run_id,
                     debug={
-                        "order_id": o.amazon_order_id,
-                        "marketplace_id": o.marketplace_id,
+                        **(e.debug or {}),
+                        "order_id": amazon_order_id,
+                        "marketplace_id": marketplace_id,
+                        "country": cc,
+                        "order_items_by_country": order_items_by_country,
+                    },
+                )
+            except Exception as e:
+                logger.error(dumps_str({"event": "fetch_items_error", "order_id": amazon_order_id, "error": str(e), "run_id": run_id}))
+                if not items_debug["first_error"]:
+                    items_debug["first_error"] = str(e)
+                raise SpapiRequestError(
+                    message=str(e),
+                    status=0,
+                    stage="fetch_order_items",
+                    run_id=run_id,
+                    debug={
+                        "order_id": amazon_order_id,
+                        "marketplace_id": marketplace_id,
                         "country": cc,
-                        "payload_keys": sorted(payload.keys()) if isinstance(payload, dict) else [],
                         "order_items_by_country": order_items_by_country,
                     },
                 )
-            if isinstance(items_list, list):
-                items_debug["items_fetched"] += len(items_list)
-            if debug_items and i == 0:
-                try:
-                    totals["_debug_order_items_sample"] = {
-                        "status": items_resp.get("status"),
-                        "ok": items_resp.get("ok"),
-                        "payload_type": type(payload).__name__,
-                        "payload_keys": sorted(payload.keys()) if isinstance(payload, dict) else [],
-                        "items_len": len(items_list) if isinstance(items_list, list) else 0,
-                    }
-                except Exception:
-                    totals["_debug_order_items_sample"] = {"error": "failed_to_capture"}
-
-            for it in items_list:
-                asin = it.get("ASIN")
-                seller_sku = it.get("SellerSKU")
-                qty_purchased = it.get("QuantityOrdered") or 0
-                
-                # Check cancellation at item level? Usually we use order status, 
-                # but item level also has QuantityCancelled.
-                units = _extract_item_units(it)
-
-                # Add to Item Raw Rows
-                raw_items_rows.append({
-                    "amazon_order_id": o.amazon_order_id,
-                    "asin": asin,
-                    "seller_sku": seller_sku,
-                    "quantity_ordered": int(qty_purchased),
-                    "item_status": o.order_status, # Inherit order status
-                    "raw_json_str": json.dumps(it, ensure_ascii=False),
-                    "country": cc,
-                    "marketplace_id": o.marketplace_id,
-                })
-
-                if is_valid_sale and units > 0:
-                    units_in_order += units
-                    items_debug["items_after_filter"] += units
-                if asin:
-                    per_order_asin_units[asin] = per_order_asin_units.get(asin, 0) + units
 
-        except SpapiRequestError as e:
-            if not items_debug["first_error"]:
-                items_debug["first_error"] = e.message
-            raise SpapiRequestError(
-                message=e.message,
-                status=e.status,
-                stage="fetch_order_items",
-                run_id=run_id,
-                debug={
-                    **(e.debug or {}),
-                    "order_id": o.amazon_order_id,
-                    "marketplace_id": o.marketplace_id,
+            # Non-Amazon orders still get a (zero) row per ASIN
+            for asin, units in per_order_asin_units.items():
+                stats = asin_agg[(cc, marketplace_id, asin)]
+                if is_canceled:
+                    stats[2] += 1
+                elif not is_non_amazon:
+                    stats[0] += 1
+                    stats[1] += units
+
+            # Update Totals
+            # Keep orders_count consistent with sales definition: exclude canceled AND Non-Amazon.
+            if is_valid_sale and order_key not in seen_non_canceled:
+                totals["orders_count"] += 1
+                cc_totals = breakdown.get(cc)
+                if cc_totals is not None:
+                    cc_totals["orders_count"] += 1
+                else:
+                    breakdown[cc] = {"marketplace_id": marketplace_id, "orders_count": 1, "units_sold": 0}
+                seen_non_canceled.add(order_key)
+
+            if is_valid_sale:
+                totals["units_sold"] += units_in_order
+                cc_totals = breakdown.get(cc)
+                if cc_totals is not None:
+                    cc_totals["units_sold"] += units_in_order
+
+            # Order Raw Row
+            # Only debug runs add fields, so only they need a copy of the order dict
+            raw_payload = {**o, "_debug_units_sold": units_in_order, "_debug_valid": is_valid_sale} if debug_items else o
+
+            orders_sink(
+                {
+                    "amazon_order_id": amazon_order_id,
+                    "marketplace_id": marketplace_id,
                     "country": cc,
-                    "order_items_by_country": order_items_by_country,
-                },
-            )
-        except Exception as e:
-            logger.error(json.dumps({"event": "fetch_items_error", "order_id": o.amazon_order_id, "error": str(e), "run_id": run_id}))
-            if not items_debug["first_error"]:
-                items_debug["first_error"] = str(e)
-            raise SpapiRequestError(
-                message=str(e),
-                status=0,
-                stage="fetch_order_items",
-                run_id=run_id,
-                debug={
-                    "order_id": o.amazon_order_id,
-                    "marketplace_id": o.marketplace_id,
-                    "country": cc,
-                    "order_items_by_country": order_items_by_country,
-                },
+                    "order_status": order_status,
+                    "units_sold": units_in_order,
+                    "raw_json_str": dumps_str(raw_payload),
+                }
             )
 
-        for asin, units in per_order_asin_units.items():
-            key = (cc, o.marketplace_id, asin)
-            if key not in asin_agg:
-                asin_agg[key] = {"orders_count": 0, "units_sold": 0, "canceled_orders": 0}
-
-            if is_canceled:
-                asin_agg[key]["canceled_orders"] += 1
-                continue
-            if is_non_amazon:
-                continue
-
-            asin_agg[key]["orders_count"] += 1
-            asin_agg[key]["units_sold"] += units
-
-        # Update Totals
-        # Keep orders_count consistent with sales definition: exclude canceled AND Non-Amazon.
-        if is_valid_sale and order_key not in seen_non_canceled:
-            totals["orders_count"] += 1
-            if cc in totals["breakdown"]:
-                totals["breakdown"][cc]["orders_count"] += 1
-            else:
-                totals["breakdown"][cc] = {"marketplace_id": o.marketplace_id, "orders_count": 1, "units_sold": 0}
-            seen_non_canceled.add(order_key)
-
-        if is_valid_sale:
-            totals["units_sold"] += units_in_order
-            if cc in totals["breakdown"]:
-                totals["breakdown"][cc]["units_sold"] += units_in_order
-
-        # Order Raw Row
-        raw_payload = dict(o.raw)
-        if debug_items:
-            raw_payload["_debug_units_sold"] = units_in_order
-            raw_payload["_debug_valid"] = is_valid_sale
-
-        raw_orders_rows.append(
-            {
-                "amazon_order_id": o.amazon_order_id,
-                "marketplace_id": o.marketplace_id,
-                "country": cc,
-                "order_status": o.order_status,
-                "units_sold": units_in_order,
-                "raw_json_str": json.dumps(raw_payload, ensure_ascii=False),
-            }
-        )
-
-        # Mild pacing to reduce 429s on orderItems
-        if i % 10 == 0:
-            logger.info(json.dumps({"event": "progress", "processed": i + 1, "total": len(orders), "run_id": run_id}))
-        time.sleep(0.08)
+            if i % 100 == 0 and logger.isEnabledFor(logging.INFO):
+                logger.info(dumps_str({"event": "progress", "processed": i + 1, "total": total_orders, "run_id": run_id}))
+    finally:
+        # Every exit, including a raise from this loop, drops the item fetches still queued
+        items_results.close()
 
     # Convert Aggregation Buffer to Rows
-    asin_daily_rows = []
-    for (cc, mid, asin), stats in asin_agg.items():
-        asin_daily_rows.append({
+    asin_daily_rows = [
+        {
             "country": cc,
             "marketplace_id": mid,
             "asin": asin,
-            "orders_count": stats["orders_count"],
-            "units_sold": stats["units_sold"],
-            "canceled_orders": stats["canceled_orders"]
-        })
+            "orders_count": orders_count,
+            "units_sold": units_sold,
+            "canceled_orders": canceled_orders,
+        }
+        for (cc, mid, asin), (orders_count, units_sold, canceled_orders) in asin_agg.items()
+    ]
 
     totals["_debug_order_items_by_country"] = order_items_by_country
-    return totals, raw_orders_rows, raw_items_rows, asin_daily_rows
+    return totals, asin_daily_rows
 
 def _bq_insert_with_fallback(
     client: bigquery.Client,
@@ -652,15 +719,24 @@ def _bq_insert_with_fallback(
     rows: List[Dict[str, Any]],
     *,
     allow_drop_fields: bool = True,
+    use_load_job: bool = True,
 ) -> Dict[str, Any]:
     """
-    Insert rows via streaming API.
+    Insert rows via streaming API (with use_load_job, batches over BQ_LOAD_JOB_THRESHOLD rows try a load job first).
+    Streaming sends one request per BQ_INSERT_BATCH rows; error indexes stay relative to `rows`.
     If BigQuery returns "no such field: X" right after a schema ALTER, retry once after dropping those fields.
     """
     if not rows:
         return {"table": table_id, "inserted": 0, "errors": []}
 
-    errors = client.insert_rows_json(table_id, rows)
+    if use_load_job and len(rows) > BQ_LOAD_JOB_THRESHOLD:
+        load_error = load_rows_json(client, table_id, rows)
+        if load_error is None:
+            return {"table": table_id, "inserted": len(rows), "errors": []}
+        # The job finished failed, so nothing was written; the streaming path below reports row errors and drops unknown fields
+        logger.warning(dumps_str({"event": "bq_load_job_failed", "table": table_id, "rows": len(rows), "error": load_error}))
+
+    errors = insert_rows_chunked(client, table_id, rows)
     if not errors:
         return {"table": table_id, "inserted": len(rows), "errors": []}
 
@@ -699,7 +775,7 @@ def _bq_insert_with_fallback(
 
     # Retry once after dropping unknown fields (schema propagation lag workaround)
     rows2 = [{k: v for k, v in r.items() if k not in unknown_fields} for r in rows]
-    errors2 = client.insert_rows_json(table_id, rows2)
+    errors2 = insert_rows_chunked(client, table_id, rows2)
     failed_indexes = sorted({
         e.get("index") for e in errors2 if isinstance(e, dict) and "index" in e
     })
@@ -713,99 +789,167 @@ def _bq_insert_with_fallback(
         "first_errors": errors[:3],
     }
 
+def _merge_insert_results(table_id: str, chunks: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+    """Combine per-chunk _bq_insert_with_fallback results; chunks are (row offset, result)."""
+    if not chunks:
+        return {"table": table_id, "inserted": 0, "errors": []}
+    if len(chunks) == 1:
+        return chunks[0][1]
+    merged: Dict[str, Any] = {"table": table_id, "inserted": 0, "errors": []}
+    dropped: set[str] = set()
+    for offset, res in chunks:
+        merged["inserted"] += res.get("inserted", 0)
+        for e in res.get("errors") or []:
+            merged["errors"].append({**e, "index": e["index"] + offset} if isinstance(e, dict) and "index" in e else e)
+        if "failed_indexes" in res:
+            merged.setdefault("failed_indexes", []).extend(i + offset for i in res["failed_indexes"])
+        if res.get("fallback_dropped_fields"):
+            dropped.update(res["fallback_dropped_fields"])
+            merged.setdefault("first_errors", res.get("first_errors") or [])
+    if dropped:
+        merged["fallback_dropped_fields"] = sorted(dropped)
+    return merged
+
+class _RawRowsWriter:
+    """
+    Sink for one raw table: rows get the per-run `const` fields and are written through
+    _bq_insert_with_fallback every RAW_ROWS_FLUSH_EVERY rows, so only one chunk is held in memory.
+    Flushes always stream: a load job per flush would block the aggregation loop on every chunk and
+    spend the per-table daily load-job quota many times per run.
+    add() takes ownership of the row and fills `const` in place rather than building a second dict.
+    client=None (dry run) only counts rows. result() flushes and returns the merged insert result.
+    """
+
+    def __init__(self, client: Optional[bigquery.Client], table_id: str, const: Dict[str, Any]) -> None:
+        self.client = client
+        self.table_id = table_id
+        self.const = const
+        self.count = 0
+        self._buf: List[Dict[str, Any]] = []
+        self._results: List[Tuple[int, Dict[str, Any]]] = []
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.count += 1
+        if self.client is None:
+            return
+        # Raw rows never carry the const keys themselves
+        row.update(self.const)
+        self._buf.append(row)
+        if len(self._buf) >= RAW_ROWS_FLUSH_EVERY:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._buf:
+            offset = self.count - len(self._buf)
+            self._results.append((offset, _bq_insert_with_fallback(self.client, self.table_id, self._buf, use_load_job=False)))
+            self._buf = []
+
+    def result(self) -> Dict[str, Any]:
+        self._flush()
+        return _merge_insert_results(self.table_id, self._results)
+
 def write_bigquery(
     scope: str,
     snapshot_date: date,
     run_id: str,
     *,
     totals: Dict[str, Any],
-    raw_orders_rows: List[Dict[str, Any]],
-    raw_items_rows: List[Dict[str, Any]],
+    orders_writer: _RawRowsWriter,
+    items_writer: _RawRowsWriter,
     asin_daily_rows: List[Dict[str, Any]],
     filter_mode: str,
     dry: bool,
+    ingested_at: str,
 ) -> Dict[str, Any]:
+    """
+    Writes the aggregate tables and flushes the raw writers (which streamed most rows during processing).
+    The four tables are independent, so the raw flushes and the ASIN insert run alongside the daily agg insert.
+    """
     if dry:
         return {"dry": True}
 
-    client = bigquery.Client()
-    ingested_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    client = bq_client()
     results = {}
-
-    # 1. Orders Raw
-    bq_rows = []
-    for r in raw_orders_rows:
-        bq_rows.append({
-            "scope": scope,
-            "snapshot_date": str(snapshot_date),
-            "amazon_order_id": r["amazon_order_id"],
-            "marketplace_id": r["marketplace_id"],
-            "raw_json_str": r["raw_json_str"],
-            "ingested_at": ingested_at,
-            "run_id": run_id,
-            "country": r.get("country", ""),
-            "units_sold": int(r.get("units_sold", 0) or 0),
-            "order_status": r.get("order_status", ""),
-        })
-    results["orders_raw"] = _bq_insert_with_fallback(client, bq_orders_raw_table_id(), bq_rows)
-
-    # 2. Daily Agg (Legacy Country Level)
-    agg_rows = []
-    for cc, v in (totals.get("breakdown") or {}).items():
-        agg_rows.append({
-            "ingested_at": ingested_at,
-            "run_id": run_id,
-            "scope": scope,
-            "snapshot_date": str(snapshot_date),
+    # Per-run columns shared by every aggregate row
+    snap = str(snapshot_date)
+    base = {"ingested_at": ingested_at, "run_id": run_id, "scope": scope, "snapshot_date": snap}
+    # asin_daily_rows already carry exactly the remaining columns
+    asin_bq = [{**base, **r} for r in asin_daily_rows]
+
+    # Daily Agg rows (Legacy Country Level)
+    agg_base = {
+        **base,
+        "filter_mode": filter_mode,
+        "excluded_canceled_orders": int(totals.get("canceled_orders", 0) or 0),
+        "excluded_non_amazon_orders": int(totals.get("excluded_non_amazon_orders", 0) or 0),
+    }
+    agg_rows = [
+        {
+            **agg_base,
             "country_code": cc,
             "marketplace_id": v.get("marketplace_id", ""),
             "orders_count": int(v.get("orders_count", 0) or 0),
             "units_sold": int(v.get("units_sold", 0) or 0),
-            "filter_mode": filter_mode,
-            "excluded_canceled_orders": int(totals.get("canceled_orders", 0) or 0),
-            "excluded_non_amazon_orders": int(totals.get("excluded_non_amazon_orders", 0) or 0),
-        })
+        }
+        for cc, v in (totals.get("breakdown") or {}).items()
+    ]
+    # Position of the EU/__ALL__ total row, known as it is appended (breakdown rows are per country)
+    eu_all_index: Optional[int] = None
     if scope.upper() == "EU":
+        eu_all_index = len(agg_rows)
         agg_rows.append({
-            "ingested_at": ingested_at,
-            "run_id": run_id,
-            "scope": scope,
-            "snapshot_date": str(snapshot_date),
+            **agg_base,
             "country_code": "EU",
             "marketplace_id": "__ALL__",
             "orders_count": int(totals.get("orders_count", 0) or 0),
             "units_sold": int(totals.get("units_sold", 0) or 0),
-            "filter_mode": filter_mode,
-            "excluded_canceled_orders": int(totals.get("canceled_orders", 0) or 0),
-            "excluded_non_amazon_orders": int(totals.get("excluded_non_amazon_orders", 0) or 0),
         })
-    logger.info(json.dumps({
+    logger.info(dumps_str({
         "event": "orders_agg_pre_insert",
         "run_id": run_id,
         "scope": scope,
-        "snapshot_date": str(snapshot_date),
+        "snapshot_date": snap,
         "agg_rows": len(agg_rows),
-        "has_eu_all": any(
-            r.get("country_code") == "EU" and r.get("marketplace_id") == "__ALL__"
-            for r in agg_rows
-        ),
+        "has_eu_all": eu_all_index is not None,
     }))
-    results["sales_daily_agg"] = _bq_insert_with_fallback(client, bq_orders_agg_table_id(), agg_rows, allow_drop_fields=False)
-    eu_all_index = next(
-        (i for i, r in enumerate(agg_rows) if r.get("country_code") == "EU" and r.get("marketplace_id") == "__ALL__"),
-        None,
-    )
+
+    # Resolved up front so a config error raises before any write has started
+    agg_table_id = bq_orders_agg_table_id()
+    asin_table_id = bq_sales_asin_daily_table_id()
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        futures = {
+            "orders_raw": ex.submit(orders_writer.result),
+            "order_items_raw": ex.submit(items_writer.result),
+            "sales_asin_daily": ex.submit(_bq_insert_with_fallback, client, asin_table_id, asin_bq),
+        }
+        try:
+            # 1. Orders Raw
+            results["orders_raw"] = futures["orders_raw"].result()
+            # 2. Daily Agg
+            results["sales_daily_agg"] = _bq_insert_with_fallback(client, agg_table_id, agg_rows, allow_drop_fields=False)
+            # 3. Items Raw
+            results["order_items_raw"] = futures["order_items_raw"].result()
+            # 4. ASIN Daily Agg
+            results["sales_asin_daily"] = futures["sales_asin_daily"].result()
+        except Exception as e:
+            # Leaving the block waits for the other writes; log their failures since only `e` is raised
+            for table, future in futures.items():
+                exc = future.exception()
+                if exc is not None and exc is not e:
+                    logger.error(dumps_str({"event": "orders_agg_write_failed", "run_id": run_id, "scope": scope, "table": table, "error": str(exc)}))
+            raise
+
     errors = results["sales_daily_agg"].get("errors") or []
     failed_indexes = results["sales_daily_agg"].get("failed_indexes") or []
     if errors:
         eu_all_failed = eu_all_index in failed_indexes if eu_all_index is not None else False
         errors_sample = errors[:3]
-        logger.error(json.dumps({
+        logger.error(dumps_str({
             "event": "orders_agg_insert_errors",
             "run_id": run_id,
             "scope": scope,
-            "snapshot_date": str(snapshot_date),
-            "table": bq_orders_agg_table_id(),
+            "snapshot_date": snap,
+            "table": agg_table_id,
             "agg_rows": len(agg_rows),
             "eu_all_index": eu_all_index,
             "eu_all_failed": eu_all_failed,
@@ -816,42 +960,6 @@ def write_bigquery(
         results["sales_daily_agg"]["eu_all_failed"] = eu_all_failed
         results["sales_daily_agg"]["errors_sample"] = errors_sample
 
-    # 3. Items Raw
-    items_bq = []
-    for r in raw_items_rows:
-        items_bq.append({
-            "run_id": run_id,
-            "ingested_at": ingested_at,
-            "scope": scope,
-            "snapshot_date": str(snapshot_date),
-            "amazon_order_id": r["amazon_order_id"],
-            "asin": r["asin"],
-            "seller_sku": r["seller_sku"],
-            "quantity_ordered": r["quantity_ordered"],
-            "item_status": r["item_status"],
-            "raw_json_str": r["raw_json_str"],
-            "country": r.get("country", ""),
-            "marketplace_id": r.get("marketplace_id", "")
-        })
-    results["order_items_raw"] = _bq_insert_with_fallback(client, bq_order_items_raw_table_id(), items_bq)
-
-    # 4. ASIN Daily Agg
-    asin_bq = []
-    for r in asin_daily_rows:
-        asin_bq.append({
-            "run_id": run_id,
-            "ingested_at": ingested_at,
-            "scope": scope,
-            "snapshot_date": str(snapshot_date),
-            "country": r["country"],
-            "marketplace_id": r["marketplace_id"],
-            "asin": r["asin"],
-            "orders_count": r["orders_count"],
-            "units_sold": r["units_sold"],
-            "canceled_orders": r["canceled_orders"]
-        })
-    results["sales_asin_daily"] = _bq_insert_with_fallback(client, bq_sales_asin_daily_table_id(), asin_bq)
-
     return results
 
 def run_daily(
@@ -865,11 +973,12 @@ def run_daily(
     max_pages: int = 50,
     page_size: int = 100,
     max_orders: int = 5000,
+    skip_canceled_items: bool = False,
 ) -> Dict[str, Any]:
     scope = scope.upper()
     run_id = str(uuid.uuid4())
-    logger.info(json.dumps({"event": "run_daily_start", "run_id": run_id, "scope": scope, "date": str(snapshot_date)}))
-    logger.info(json.dumps({"event": "run_daily_after_start", "run_id": run_id, "scope": scope, "snapshot_date": str(snapshot_date)}))
+    logger.info(dumps_str({"event": "run_daily_start", "run_id": run_id, "scope": scope, "date": str(snapshot_date)}))
+    logger.info(dumps_str({"event": "run_daily_after_start", "run_id": run_id, "scope": scope, "snapshot_date": str(snapshot_date)}))
 
     orders, tw_debug = fetch_orders_for_scope(
         scope=scope,
@@ -882,16 +991,27 @@ def run_daily(
         include_debug=debug_items,
         compact=compact,
     )
-    agg_pre_by_marketplace: Dict[str, int] = {}
-    for o in orders:
-        agg_pre_by_marketplace[o.marketplace_id] = agg_pre_by_marketplace.get(o.marketplace_id, 0) + 1
-    status_breakdown: Dict[str, int] = {}
-    for o in orders:
-        key = (o.order_status or "").strip() or "UNKNOWN"
-        status_breakdown[key] = status_breakdown.get(key, 0) + 1
-
-    totals, raw_orders, raw_items, asin_rows = process_orders_and_items(
-        scope, orders, debug_items=debug_items, run_id=run_id, window_info=tw_debug
+    agg_pre_by_marketplace: Dict[str, int] = dict(Counter(o["MarketplaceId"] for o in orders))
+    status_breakdown: Dict[str, int] = dict(
+        Counter(str(o.get("OrderStatus") or "").strip() or "UNKNOWN" for o in orders)
+    )
+
+    client = None if dry else bq_client()
+    ingested_at = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    const = {"scope": scope, "snapshot_date": str(snapshot_date), "ingested_at": ingested_at, "run_id": run_id}
+    # Dry runs only count rows, and must not need BQ_PROJECT
+    orders_writer = _RawRowsWriter(client, bq_orders_raw_table_id() if client else "", const)
+    items_writer = _RawRowsWriter(client, bq_order_items_raw_table_id() if client else "", const)
+
+    totals, asin_rows = process_orders_and_items(
+        scope,
+        orders,
+        debug_items=debug_items,
+        run_id=run_id,
+        window_info=tw_debug,
+        orders_sink=orders_writer.add,
+        items_sink=items_writer.add,
+        skip_canceled_items=skip_canceled_items,
     )
 
     bq_res = write_bigquery(
@@ -899,11 +1019,12 @@ def run_daily(
         snapshot_date=snapshot_date,
         run_id=run_id,
         totals=totals,
-        raw_orders_rows=raw_orders,
-        raw_items_rows=raw_items,
+        orders_writer=orders_writer,
+        items_writer=items_writer,
         asin_daily_rows=asin_rows,
         filter_mode=filter_mode,
         dry=dry,
+        ingested_at=ingested_at,
     )
 
     resp = {
@@ -918,7 +1039,7 @@ def run_daily(
         "orders_canceled_total": tw_debug.get("orders_canceled_total", 0),
         "units_sold": totals["units_sold"],
         "breakdown": totals["breakdown"],
-        "items_rows_count": len(raw_items),
+        "items_rows_count": items_writer.count,
         "asin_stats_count": len(asin_rows),
         "bq": bq_res,
         "time_window_debug": tw_debug,
@@ -944,7 +1065,7 @@ def run_daily(
             },
         }
 
-    if (not dry) and totals["orders_count"] > 0 and len(raw_items) == 0:
+    if (not dry) and totals["orders_count"] > 0 and items_writer.count == 0:
         err_resp = {
             "ok": False,
             "status": "ORDER_ITEMS_EMPTY",
@@ -957,7 +1078,7 @@ def run_daily(
             "orders_canceled_total": tw_debug.get("orders_canceled_total", 0),
             "units_sold": totals["units_sold"],
             "breakdown": totals["breakdown"],
-            "items_rows_count": len(raw_items),
+            "items_rows_count": items_writer.count,
             "asin_stats_count": len(asin_rows),
             "time_window_debug": tw_debug,
         }
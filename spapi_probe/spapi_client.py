@@ -1,8 +1,9 @@
 import base64
+import functools
 import hashlib
 import hmac
-import json
 import os
+import threading
 import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
@@ -11,6 +12,8 @@ from urllib.parse import urlencode
 
 import requests
 
+from .utils_json import dumps_bytes, loads as json_loads
+
 
 # -----------------------------
 # Region config
@@ -35,6 +38,23 @@ _REGION_TO_REFRESH_ENV = {
     "FE": "LWA_REFRESH_TOKEN_FE",
 }
 
+# SigV4 fixed parts; the signing key over them is cached per day in _sigv4_signing_key
+_SIGV4_ALGORITHM = "AWS4-HMAC-SHA256"
+_SIGV4_TERMINATOR = "aws4_request"
+
+
+@functools.lru_cache(maxsize=1)
+def _http_session() -> requests.Session:
+    """
+    One pooled session per process: pages reuse keep-alive TLS connections to SP-API/LWA.
+    Retries stay in the callers' backoff loops, so the adapter itself never retries.
+    """
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=0))
+    return session
+
 
 def _utc_amz_date() -> Tuple[str, str]:
     """
@@ -56,6 +76,8 @@ def _hmac_sha256(key: bytes, msg: str) -> bytes:
     return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
 
 
+# The key only changes with the UTC date (or a rotated secret, which is part of the cache key)
+@functools.lru_cache(maxsize=8)
 def _sigv4_signing_key(secret_key: str, date_stamp: str, region: str, service: str) -> bytes:
     k_date = _hmac_sha256(("AWS4" + secret_key).encode("utf-8"), date_stamp)
     k_region = hmac.new(k_date, region.encode("utf-8"), hashlib.sha256).digest()
@@ -71,6 +93,9 @@ class LwaToken:
 
 
 _LWA_TOKEN_CACHE: Dict[str, LwaToken] = {}
+# One lock per cache key: concurrent callers on a cold/expired token wait for a single refresh
+_LWA_REFRESH_LOCKS: Dict[str, threading.Lock] = {}
+_LWA_REFRESH_LOCKS_GUARD = threading.Lock()
 
 
 def _get_env_required(name: str) -> str:
@@ -79,6 +104,8 @@ def _get_env_required(name: str) -> str:
         raise RuntimeError(f"Missing required env var: {name}")
     return v
 
+# Called several times per request (token, host, refresh env) with a handful of distinct inputs
+@functools.lru_cache(maxsize=16)
 def _normalize_scope(scope: str) -> str:
     scope_u = (scope or "NA").upper()
     if scope_u == "UK":
@@ -107,27 +134,50 @@ def _select_refresh_token(scope: str) -> str:
     )
 
 
+def _cached_lwa_token(cache_key: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """(access_token, debug) if the cached token has more than 60s left, else None."""
+    cached = _LWA_TOKEN_CACHE.get(cache_key)
+    now = time.time()
+    if cached and cached.expires_at - now > 60:
+        debug: Dict[str, Any] = {
+            "cached": True,
+            "expires_in": int(cached.expires_at - now),
+            "status_code": 200,
+            "token_type": "bearer",
+            "token_url": "https://api.amazon.com/auth/o2/token",
+            "access_token_len": len(cached.access_token),
+        }
+        return cached.access_token, debug
+    return None
+
+
 def _get_lwa_access_token(region: str) -> Tuple[str, Dict[str, Any]]:
     """
     Returns (access_token, debug_dict)
-    Caches per-region token in memory (Cloud Run instance).
+    Caches per-region token in memory (Cloud Run instance); hits take no lock.
     """
-    debug: Dict[str, Any] = {}
     region = _normalize_scope(region)
 
     cache_key = f"lwa:{region}"
-    cached = _LWA_TOKEN_CACHE.get(cache_key)
+    hit = _cached_lwa_token(cache_key)
+    if hit:
+        return hit
+
+    with _LWA_REFRESH_LOCKS_GUARD:
+        lock = _LWA_REFRESH_LOCKS.setdefault(cache_key, threading.Lock())
+    with lock:
+        # Another thread may have refreshed while this one waited
+        hit = _cached_lwa_token(cache_key)
+        if hit:
+            return hit
+        return _refresh_lwa_access_token(region, cache_key)
+
+
+def _refresh_lwa_access_token(region: str, cache_key: str) -> Tuple[str, Dict[str, Any]]:
+    """POST the refresh token to LWA and cache the new access token under cache_key."""
+    debug: Dict[str, Any] = {}
     now = time.time()
 
-    if cached and cached.expires_at - now > 60:
-        debug["cached"] = True
-        debug["expires_in"] = int(cached.expires_at - now)
-        debug["status_code"] = 200
-        debug["token_type"] = "bearer"
-        debug["token_url"] = "https://api.amazon.com/auth/o2/token"
-        debug["access_token_len"] = len(cached.access_token)
-        return cached.access_token, debug
-
     client_id = _get_env_required("LWA_CLIENT_ID")
     client_secret = _get_env_required("LWA_CLIENT_SECRET")
 
@@ -141,7 +191,7 @@ def _get_lwa_access_token(region: str) -> Tuple[str, Dict[str, Any]]:
         "client_secret": client_secret,
     }
 
-    r = requests.post(token_url, data=payload, timeout=30)
+    r = _http_session().post(token_url, data=payload, timeout=30)
     debug["cached"] = False
     debug["status_code"] = r.status_code
     debug["token_url"] = token_url
@@ -173,13 +223,8 @@ def _canonical_query_string(query: Optional[Dict[str, Any]]) -> str:
     if not query:
         return ""
     # SigV4 requires query params sorted by key, and values URL-encoded
-    items = []
-    for k in sorted(query.keys()):
-        v = query[k]
-        if v is None:
-            continue
-        # SP-API expects repeated params sometimes; keep simple: stringify
-        items.append((str(k), str(v)))
+    # SP-API expects repeated params sometimes; keep simple: stringify
+    items = [(str(k), str(v)) for k, v in sorted(query.items()) if v is not None]
     return urlencode(items, safe="-_.~")
 
 
@@ -189,17 +234,15 @@ def _canonical_headers(headers: Dict[str, str]) -> Tuple[str, str]:
       canonical_headers: 'key:val\n...'
       signed_headers: 'key;key;...'
     """
-    cleaned = {}
-    for k, v in headers.items():
-        if v is None:
-            continue
-        lk = k.strip().lower()
-        lv = " ".join(str(v).strip().split())
-        cleaned[lk] = lv
-
-    keys = sorted(cleaned.keys())
-    canonical = "".join([f"{k}:{cleaned[k]}\n" for k in keys])
-    signed = ";".join(keys)
+    # Dict first: keys differing only in case/whitespace collapse to one header (last wins)
+    cleaned = {
+        k.strip().lower(): " ".join(str(v).strip().split())
+        for k, v in headers.items()
+        if v is not None
+    }
+    items = sorted(cleaned.items())
+    canonical = "".join([k + ":" + v + "\n" for k, v in items])
+    signed = ";".join([k for k, _ in items])
     return canonical, signed
 
 
@@ -243,7 +286,7 @@ def spapi_request(
         content_type = None
     else:
         if isinstance(body, (dict, list)):
-            payload_bytes = json.dumps(body, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+            payload_bytes = dumps_bytes(body)
             content_type = "application/json"
         elif isinstance(body, (bytes, bytearray)):
             payload_bytes = bytes(body)
@@ -284,8 +327,8 @@ def spapi_request(
         ]
     )
 
-    algorithm = "AWS4-HMAC-SHA256"
-    credential_scope = f"{date_stamp}/{aws_region}/{service}/aws4_request"
+    algorithm = _SIGV4_ALGORITHM
+    credential_scope = f"{date_stamp}/{aws_region}/{service}/{_SIGV4_TERMINATOR}"
     string_to_sign = "\n".join(
         [
             algorithm,
@@ -316,11 +359,12 @@ def spapi_request(
         "status_code": None,
         "request_id": None,
         "rid": None,
+        "rate_limit": None,
         "lwa": lwa_debug,
     }
 
     try:
-        r = requests.request(method, url, headers=req_headers, data=payload_bytes, timeout=timeout)
+        r = _http_session().request(method, url, headers=req_headers, data=payload_bytes, timeout=timeout)
     except Exception as e:
         debug["status_code"] = 0
         debug["error"] = repr(e)
@@ -330,15 +374,21 @@ def spapi_request(
     # Common request id headers
     debug["request_id"] = r.headers.get("x-amzn-RequestId") or r.headers.get("x-amz-request-id")
     debug["rid"] = r.headers.get("x-amz-rid") or r.headers.get("x-amzn-rid")
+    # Current per-operation rate (requests/sec) granted to this selling partner
+    debug["rate_limit"] = r.headers.get("x-amzn-RateLimit-Limit")
+    retry_after = r.headers.get("Retry-After")
+    if retry_after:
+        debug["retry_after"] = retry_after
 
     # Parse response
+    # Parse from raw bytes: skips decoding to str before the JSON parse
     resp_body: Any
-    text = r.text if r.text is not None else ""
-    if text:
+    content = r.content or b""
+    if content:
         try:
-            resp_body = r.json()
+            resp_body = json_loads(content)
         except Exception:
-            resp_body = text
+            resp_body = r.text
     else:
         resp_body = ""
 
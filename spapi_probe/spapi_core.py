@@ -1,11 +1,14 @@
 # spapi_core.py
 from __future__ import annotations
 
-import json
-from typing import Any, Dict, Optional
+import functools
+import random
+import time
+from typing import Any, Callable, Dict, List, Optional
 from urllib.parse import urlencode
 
 from .spapi_client import spapi_request
+from .utils_json import dumps_bytes
 
 
 class SpapiRequestError(RuntimeError):
@@ -36,6 +39,72 @@ class SpapiRequestError(RuntimeError):
         }
 
 
+# Throttled / temporarily unavailable; everything else is final
+RETRYABLE_STATUS = frozenset((429, 503, 504))
+
+
+def _retry_after_seconds(debug: Any) -> Optional[float]:
+    """Retry-After (delta-seconds form) as recorded in debug["retry_after"] by spapi_client."""
+    if not isinstance(debug, dict):
+        return None
+    try:
+        value = float(debug.get("retry_after") or 0)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+def backoff_sleep(base_sleep: float, attempt: int, max_sleep: float = 30.0, retry_after: Optional[float] = None) -> None:
+    """
+    Full-jitter exponential backoff: a uniform sleep in [0, min(max_sleep, base_sleep * 2**attempt)],
+    so parallel fetches that were throttled together spread out instead of retrying in lockstep.
+    A server-provided Retry-After takes precedence (still capped at max_sleep).
+    """
+    if retry_after:
+        time.sleep(min(max_sleep, retry_after))
+        return
+    time.sleep(random.uniform(0, min(max_sleep, base_sleep * (2 ** attempt))))
+
+
+def retry_spapi(
+    fn: Callable[[], Dict[str, Any]],
+    *,
+    stage: str,
+    run_id: str,
+    max_tries: int = 4,
+    base_sleep: float = 1.0,
+) -> Dict[str, Any]:
+    """
+    Retry a spapi_request_json() call on 429/503/504.
+    Non-retriable failures raise SpapiRequestError immediately; no sleep follows the last attempt.
+    """
+    for i in range(max_tries):
+        last_try = i == max_tries - 1
+        try:
+            resp = fn()
+        except SpapiRequestError as e:
+            if last_try or e.status not in RETRYABLE_STATUS:
+                raise
+            debug = e.debug
+        else:
+            if not isinstance(resp, dict) or resp.get("ok", False):
+                return resp
+            status = int(resp.get("status") or 0)
+            if last_try or status not in RETRYABLE_STATUS:
+                raise SpapiRequestError(
+                    message=resp.get("error") or "SP-API request failed",
+                    status=status,
+                    stage=stage,
+                    run_id=run_id,
+                    debug=resp.get("debug") or {},
+                )
+            debug = resp.get("debug")
+        backoff_sleep(base_sleep, i, retry_after=_retry_after_seconds(debug))
+    raise RuntimeError("SP-API retry exhausted")
+
+
+# A handful of distinct scope strings; each call returns the same cached str object
+@functools.lru_cache(maxsize=16)
 def _normalize_scope(scope: str) -> str:
     scope_u = (scope or "").upper()
     if scope_u == "UK":
@@ -89,10 +158,12 @@ def spapi_request_json(
 
         if not out["ok"]:
             if status_int in (401, 403):
-                resp_text = resp_body
-                if not isinstance(resp_text, str):
-                    resp_text = json.dumps(resp_body, ensure_ascii=True)
-                out["debug"]["response_text_trunc"] = (resp_text or "")[:2000]
+                if isinstance(resp_body, str):
+                    resp_text = resp_body[:2000]
+                else:
+                    # Cut the encoded bytes, then decode only that prefix (a split character is dropped)
+                    resp_text = dumps_bytes(resp_body)[:2000].decode("utf-8", "ignore")
+                out["debug"]["response_text_trunc"] = resp_text
             out["error"] = _extract_error_message(resp_body, status)
             out["payload"] = {}
         return out
@@ -104,10 +175,13 @@ def spapi_request_json(
             http_status = int(getattr(response, "status_code", 0) or 0)
         except Exception:
             http_status = 0
+        # Only failures reach here; an empty query needs neither the encode nor the sort
         request_url = path
+        query_keys: List[str] = []
         if query:
             request_url = f"{path}?{urlencode(query)}"
-        query_keys = sorted(query.keys()) if isinstance(query, dict) else []
+            if isinstance(query, dict):
+                query_keys = sorted(query)
         trace_id = None
         if response is not None:
             headers_map = getattr(response, "headers", None)
@@ -155,8 +229,9 @@ def _extract_error_message(resp_body: Any, status: Any) -> str:
 
     if isinstance(resp_body, dict):
         # SP-API sometimes returns {"errors":[{"message":...,"code":...}]}
-        if "errors" in resp_body and isinstance(resp_body["errors"], list) and resp_body["errors"]:
-            first = resp_body["errors"][0] or {}
+        errors = resp_body.get("errors")
+        if isinstance(errors, list) and errors:
+            first = errors[0] or {}
             msg = first.get("message") or first.get("details") or str(first)
             code = first.get("code")
             if code:
@@ -165,9 +240,9 @@ def _extract_error_message(resp_body: Any, status: Any) -> str:
 
         # Or {"message": "..."} or {"error": "..."}
         if "message" in resp_body:
-            return f"HTTP {st}: {resp_body.get('message')}"
+            return f"HTTP {st}: {resp_body['message']}"
         if "error" in resp_body:
-            return f"HTTP {st}: {resp_body.get('error')}"
+            return f"HTTP {st}: {resp_body['error']}"
 
         return f"HTTP {st}: {str(resp_body)[:500]}"
 
@@ -1,25 +1,32 @@
 from __future__ import annotations
 
+import functools
 import os
-from typing import List
+from typing import Tuple
 
+_REQUIRED_ENVS = (
+    "AWS_ACCESS_KEY_ID",
+    "AWS_SECRET_ACCESS_KEY",
+    "AWS_REGION",
+    "LWA_CLIENT_ID",
+    "LWA_CLIENT_SECRET",
+)
+# Any one of these is enough
+_REFRESH_TOKEN_ENVS = (
+    "LWA_REFRESH_TOKEN_EU",
+    "LWA_REFRESH_TOKEN_NA",
+    "LWA_REFRESH_TOKEN",
+)
 
-def get_missing_required_envs() -> List[str]:
-    required = [
-        "AWS_ACCESS_KEY_ID",
-        "AWS_SECRET_ACCESS_KEY",
-        "AWS_REGION",
-        "LWA_CLIENT_ID",
-        "LWA_CLIENT_SECRET",
-    ]
-    missing = [name for name in required if not os.getenv(name)]
 
-    refresh_candidates = [
-        "LWA_REFRESH_TOKEN_EU",
-        "LWA_REFRESH_TOKEN_NA",
-        "LWA_REFRESH_TOKEN",
-    ]
-    if not any(os.getenv(name) for name in refresh_candidates):
-        missing.append("LWA_REFRESH_TOKEN_EU|LWA_REFRESH_TOKEN_NA|LWA_REFRESH_TOKEN")
+# Cloud Run fixes the environment at instance start, so the answer is computed once per process.
+# Tests that change env vars call get_missing_required_envs.cache_clear().
+@functools.lru_cache(maxsize=1)
+def get_missing_required_envs() -> Tuple[str, ...]:
+    env = os.environ
+    missing = [name for name in _REQUIRED_ENVS if not env.get(name)]
+    if not any(env.get(name) for name in _REFRESH_TOKEN_ENVS):
+        missing.append("|".join(_REFRESH_TOKEN_ENVS))
 
-    return missing
+    # A tuple, since every caller shares the cached value
+    return tuple(missing)
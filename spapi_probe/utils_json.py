@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import json
+from typing import Any
+
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+HAVE_ORJSON = orjson is not None
+
+
+def dumps_str(obj: Any) -> str:
+    """
+    Compact JSON string for raw_json_str columns.
+    orjson (C extension) when installed; falls back to json for anything it rejects (e.g. non-str keys).
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """Compact UTF-8 JSON body (same bytes as json.dumps(separators=(",", ":"), ensure_ascii=False))."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def loads(raw: bytes) -> Any:
+    """Parse a JSON response body straight from bytes; raises ValueError on invalid JSON."""
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except orjson.JSONDecodeError:
+            # Not UTF-8 JSON (e.g. UTF-16 body); let json detect the encoding
+            pass
+    return json.loads(raw)
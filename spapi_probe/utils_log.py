@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from .utils_json import dumps_str
+
+
+class JsonFieldsFormatter(logging.Formatter):
+    """
+    Renders records logged with extra={"json_fields": {...}} as one JSON line:
+      {"event": <msg>, "severity": <level>, **json_fields}
+    "severity" is the key Cloud Logging reads; a traceback (logger.exception) goes into "traceback".
+    Records without json_fields go through `base` (the handler's previous formatter), unchanged.
+    """
+
+    def __init__(self, base: Optional[logging.Formatter] = None) -> None:
+        super().__init__()
+        self.base = base or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "json_fields", None)
+        if fields is None:
+            return self.base.format(record)
+        payload: Dict[str, Any] = {"event": record.getMessage(), "severity": record.levelname, **fields}
+        if record.exc_info:
+            payload["traceback"] = self.formatException(record.exc_info)
+        try:
+            return dumps_str(payload)
+        except TypeError:
+            # e.g. objects without a JSON form inside debug dicts
+            return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def install_json_formatter(logger: logging.Logger) -> None:
+    """Put JsonFieldsFormatter on every handler of `logger` (the root logger at startup)."""
+    for handler in logger.handlers:
+        if not isinstance(handler.formatter, JsonFieldsFormatter):
+            handler.setFormatter(JsonFieldsFormatter(handler.formatter))
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+
+class RatePacer:
+    """
+    Token bucket pacing calls to one SP-API operation.
+    rate is requests/second; SP-API reports the current value in x-amzn-RateLimit-Limit.
+    """
+
+    def __init__(self, rate: float, burst: float = 1.0) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def update_rate(self, rate: Optional[float]) -> None:
+        if rate and rate > 0:
+            with self._lock:
+                self.rate = rate
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            # Take the token up front (may go negative) so concurrent callers queue behind each other
+            self._tokens -= 1.0
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if delay > 0:
+            time.sleep(delay)
+
+
+_PACERS: Dict[Tuple[str, str], RatePacer] = {}
+_PACERS_LOCK = threading.Lock()
+
+
+def pacer_for(scope: str, path: str, default_rate: float, burst: float = 1.0) -> RatePacer:
+    """One pacer per (scope, path); SP-API limits apply per region and operation."""
+    key = (scope, path)
+    with _PACERS_LOCK:
+        pacer = _PACERS.get(key)
+        if pacer is None:
+            pacer = _PACERS[key] = RatePacer(default_rate, burst)
+        return pacer
+
+
+def rate_limit_from_debug(debug: Any) -> Optional[float]:
+    """Parse the x-amzn-RateLimit-Limit value spapi_client records in debug["rate_limit"]."""
+    if not isinstance(debug, dict):
+        return None
+    try:
+        return float(debug.get("rate_limit") or 0) or None
+    except (TypeError, ValueError):
+        return None
@@ -1,16 +1,30 @@
 from datetime import datetime, timedelta, timezone, date
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 from typing import Tuple
 
+@lru_cache(maxsize=8)
+def _zone(tz_name: str) -> ZoneInfo:
+    # Only a handful of scope timezones; skip the per-call ZoneInfo key lookup
+    return ZoneInfo(tz_name)
+
 def iso_z(dt: datetime) -> str:
-    return dt.astimezone(timezone.utc).replace(microsecond=0).isoformat().replace("+00:00", "Z")
+    # Already-UTC and whole-second values skip the conversion/replace copies
+    if dt.tzinfo is not timezone.utc:
+        dt = dt.astimezone(timezone.utc)
+    if dt.microsecond:
+        dt = dt.replace(microsecond=0)
+    # isoformat() of a UTC datetime always ends in "+00:00"
+    return dt.isoformat()[:-6] + "Z"
 
+# Pure in (tz, day) and returns immutable strings; probes and reruns ask for the same window repeatedly
+@lru_cache(maxsize=64)
 def day_window_utc(tz_name: str, snapshot_day: date) -> Tuple[str, str]:
-    tz = ZoneInfo(tz_name)
+    tz = _zone(tz_name)
     start_local = datetime(snapshot_day.year, snapshot_day.month, snapshot_day.day, 0, 0, 0, tzinfo=tz)
     end_local = start_local + timedelta(days=1)
     return iso_z(start_local), iso_z(end_local)
 
 def yesterday_local(tz_name: str) -> date:
-    now_local = datetime.now(ZoneInfo(tz_name))
+    now_local = datetime.now(_zone(tz_name))
     return now_local.date() - timedelta(days=1)